@@ -1,8 +1,10 @@
-from .database import get_session, init_db
+from .database import get_session, get_async_session, get_read_session, init_db
 from .models import User, Master, Service, Appointment
 
 __all__ = [
     "get_session",
+    "get_async_session",
+    "get_read_session",
     "init_db",
     "User",
     "Master",
@@ -0,0 +1,149 @@
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.routing import Match
+from typing import Optional
+from auth import PASSWORD_HASH_WORKERS
+from cache import TTLCache
+import math
+import os
+import time
+
+
+def _parse_limits(raw: str) -> dict[str, float]:
+    # "login=8,create_user=8" -> {"login": 8.0, "create_user": 8.0}
+    limits = {}
+    for item in raw.split(","):
+        if item.strip():
+            name, _, value = item.partition("=")
+            limits[name.strip()] = float(value)
+    return limits
+
+
+# bcrypt routes share PASSWORD_HASH_WORKERS processes; admitting this many
+# hashes per process keeps an admitted request's wait to a few hash times.
+ADMISSION_HASHES_PER_WORKER = int(os.getenv("ADMISSION_HASHES_PER_WORKER", "2"))
+HASH_ROUTE_LIMIT = PASSWORD_HASH_WORKERS * ADMISSION_HASHES_PER_WORKER
+
+# Keyed by handler name. Requests over the limit get 503 at once instead of
+# waiting for a worker behind everyone else.
+ADMISSION_CONCURRENCY = _parse_limits(os.getenv(
+    "ADMISSION_CONCURRENCY",
+    f"login={HASH_ROUTE_LIMIT},create_user={HASH_ROUTE_LIMIT},get_appointments=128",
+))
+# Per-client token buckets: sustained requests/second and burst size.
+# Requests over the rate get 429.
+ADMISSION_RATE = _parse_limits(os.getenv("ADMISSION_RATE", ""))
+ADMISSION_BURST = _parse_limits(os.getenv("ADMISSION_BURST", ""))
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "100000"))
+# Take the client address from X-Forwarded-For (only behind a trusted proxy).
+ADMISSION_TRUST_FORWARDED = os.getenv(
+    "ADMISSION_TRUST_FORWARDED", "false"
+).lower() in ("1", "true", "yes")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        # Returns 0 if a token was taken, else seconds until one is free.
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        concurrency: dict[str, float],
+        rates: dict[str, float],
+        bursts: dict[str, float],
+    ):
+        self.concurrency = concurrency
+        self.rates = rates
+        self.bursts = bursts
+        self.in_flight = {name: 0 for name in concurrency}
+        # (route, reason) -> requests shed
+        self.shed: dict[tuple[str, str], int] = {}
+        self._buckets = TTLCache(ADMISSION_MAX_CLIENTS)
+        self._routes: list[APIRoute] = []
+
+    def bind(self, routes) -> None:
+        # Only the limited routes are matched per request, before routing.
+        limited = self.concurrency.keys() | self.rates.keys()
+        self._routes = [
+            route for route in routes
+            if isinstance(route, APIRoute) and route.name in limited
+        ]
+
+    def _match(self, scope: dict) -> Optional[str]:
+        for route in self._routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.name
+        return None
+
+    def _client(self, request: Request) -> str:
+        if ADMISSION_TRUST_FORWARDED:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    def _reject(self, name: str, reason: str, status_code: int, retry_after: float):
+        self.shed[(name, reason)] = self.shed.get((name, reason), 0) + 1
+        detail = (
+            "Too many requests" if status_code == 429
+            else "Server is busy, retry shortly"
+        )
+        return JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def _wait_for_token(self, name: str, request: Request) -> float:
+        rate = self.rates.get(name)
+        if not rate:
+            return 0.0
+        burst = self.bursts.get(name, max(1.0, rate))
+        key = (name, self._client(request))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+        # Dropped once idle long enough to have refilled completely.
+        self._buckets.set(key, bucket, ttl=burst / rate)
+        return bucket.take()
+
+    async def handle(self, request: Request, call_next) -> Response:
+        name = self._match(request.scope) if self._routes else None
+        if name is None:
+            return await call_next(request)
+
+        wait = self._wait_for_token(name, request)
+        if wait > 0:
+            return self._reject(name, "rate", 429, wait)
+
+        limit = self.concurrency.get(name)
+        if limit is None:
+            return await call_next(request)
+        if self.in_flight[name] >= limit:
+            return self._reject(name, "concurrency", 503, 1)
+
+        # Held until the response starts; streamed bodies are not covered.
+        self.in_flight[name] += 1
+        try:
+            return await call_next(request)
+        finally:
+            self.in_flight[name] -= 1
+
+
+admission = AdmissionController(ADMISSION_CONCURRENCY, ADMISSION_RATE, ADMISSION_BURST)
@@ -1,8 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from passlib.context import CryptContext
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+from cache import TTLCache
+from database import get_async_session
+from jwt_utils import verify_token
+from models import User
+from schemas import UserRead
+import asyncio
+import os
+import time
+import uuid
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
 pwd_context = CryptContext(
     schemes=["bcrypt"],
-    deprecated="auto"
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
 )
 
 def get_password_hash(password: str) -> str:
@@ -10,3 +32,94 @@ def get_password_hash(password: str) -> str:
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    # bcrypt holds the GIL for the whole hash, so it runs in worker
+    # processes; the event loop only awaits the result.
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._completed = 0
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    async def _submit(self, fn, *args):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+            self._completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self._pending,
+            "queued": max(0, self._pending - self.workers),
+            "completed": self._completed,
+            "rounds": BCRYPT_ROUNDS,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS)
+
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# Verified bearer token -> resolved user, kept until the token's exp.
+token_cache = TTLCache(TOKEN_CACHE_SIZE)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    session: AsyncSession = Depends(get_async_session),
+) -> UserRead:
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+
+    token = credentials.credentials
+    current_user = token_cache.get(token)
+    if current_user is not None:
+        return current_user
+
+    payload = verify_token(token)
+    if payload is None or "sub" not in payload or "exp" not in payload:
+        raise _unauthorized("Invalid token")
+
+    statement = select(User).where(User.email == payload["sub"])
+    user = (await session.exec(statement)).first()
+
+    if not user:
+        raise _unauthorized("Invalid token")
+
+    current_user = UserRead.model_validate(user)
+    token_cache.set(token, current_user, ttl=payload["exp"] - time.time())
+    return current_user
+
+
+def forget_user(user_id: uuid.UUID) -> None:
+    # Local only; delete_user also has the other workers forget the user
+    # through the appointment feed.
+    token_cache.discard_where(lambda _, user: user.id == user_id)
@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Appointment, CANCELLED_STATUSES
+from cache import Generation
+import os
+import threading
+import uuid
+
+OPENING_HOUR = int(os.getenv("SALON_OPENING_HOUR", "9"))
+CLOSING_HOUR = int(os.getenv("SALON_CLOSING_HOUR", "21"))
+SLOT_MINUTES = int(os.getenv("AVAILABILITY_SLOT_MINUTES", "15"))
+MAX_CACHED_DAYS = int(os.getenv("AVAILABILITY_CACHE_DAYS", "20000"))
+
+MINUTES_PER_DAY = 24 * 60
+
+Interval = tuple[int, int, uuid.UUID]
+DayKey = tuple[uuid.UUID, date]
+
+
+class OccupancyIndex:
+    # Busy intervals per (master, day) in minutes since midnight, sorted by
+    # start. Days are loaded from the appointments table on first use and
+    # then kept current by the appointment write paths.
+    def __init__(self, max_days: int = MAX_CACHED_DAYS):
+        self._max_days = max_days
+        self._days: "OrderedDict[DayKey, list[Interval]]" = OrderedDict()
+        self._locations: dict[uuid.UUID, DayKey] = {}
+        self._generation = Generation()
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation.value
+
+    def get(self, master_id: uuid.UUID, day: date) -> Optional[list[Interval]]:
+        key = (master_id, day)
+        with self._lock:
+            intervals = self._days.get(key)
+            if intervals is not None:
+                self._days.move_to_end(key)
+            return intervals
+
+    def load(
+        self,
+        master_id: uuid.UUID,
+        day: date,
+        intervals: list[Interval],
+        generation: int,
+    ) -> list[Interval]:
+        intervals = sorted(intervals)
+        key = (master_id, day)
+        with self._lock:
+            # A write landed while the day was being read; the snapshot may
+            # miss it, so serve it once without caching.
+            if not self._generation.unchanged_since(generation):
+                return intervals
+            self._days[key] = intervals
+            for _, _, appointment_id in intervals:
+                self._locations[appointment_id] = key
+            while len(self._days) > self._max_days:
+                _, evicted = self._days.popitem(last=False)
+                for _, _, appointment_id in evicted:
+                    self._locations.pop(appointment_id, None)
+        return intervals
+
+    def add(
+        self,
+        appointment_id: uuid.UUID,
+        master_id: uuid.UUID,
+        start: datetime,
+        end: datetime,
+    ) -> None:
+        key = (master_id, start.date())
+        with self._lock:
+            self._generation.advance()
+            self._discard(appointment_id)
+            intervals = self._days.get(key)
+            if intervals is None:
+                return
+            interval = (*_interval(start, end), appointment_id)
+            # Readers iterate the list outside the lock, so swap in a copy.
+            self._days[key] = sorted([*intervals, interval])
+            self._locations[appointment_id] = key
+
+    def discard(self, appointment_id: uuid.UUID) -> None:
+        with self._lock:
+            self._generation.advance()
+            self._discard(appointment_id)
+
+    def discard_days(self, keys: Iterable[DayKey]) -> None:
+        with self._lock:
+            self._generation.advance()
+            for key in keys:
+                self._drop_day(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation.advance()
+            self._days.clear()
+            self._locations.clear()
+
+    def _drop_day(self, key: DayKey) -> None:
+        for _, _, appointment_id in self._days.pop(key, ()):
+            self._locations.pop(appointment_id, None)
+
+    def _discard(self, appointment_id: uuid.UUID) -> None:
+        key = self._locations.pop(appointment_id, None)
+        if key is None:
+            return
+        intervals = self._days.get(key)
+        if intervals is not None:
+            self._days[key] = [i for i in intervals if i[2] != appointment_id]
+
+
+occupancy = OccupancyIndex()
+
+
+def _interval(start: datetime, end: datetime) -> tuple[int, int]:
+    begin = start.hour * 60 + start.minute
+    length = (end - start).total_seconds() // 60
+    return begin, min(begin + int(length), MINUTES_PER_DAY)
+
+
+async def get_busy_intervals(
+    session: AsyncSession,
+    master_id: uuid.UUID,
+    day: date,
+) -> list[Interval]:
+    intervals = occupancy.get(master_id, day)
+    if intervals is not None:
+        return intervals
+
+    generation = occupancy.generation()
+    day_start = datetime.combine(day, time.min)
+    statement = (
+        select(Appointment.id, Appointment.date_time, Appointment.end_time)
+        .where(
+            Appointment.master_id == master_id,
+            Appointment.date_time >= day_start,
+            Appointment.date_time < day_start + timedelta(days=1),
+            Appointment.status.not_in(CANCELLED_STATUSES),
+        )
+    )
+    rows = (await session.exec(statement)).all()
+    loaded = [
+        (*_interval(date_time, end_time), appointment_id)
+        for appointment_id, date_time, end_time in rows
+    ]
+    return occupancy.load(master_id, day, loaded, generation)
+
+
+def free_slots(intervals: list[Interval], duration: int) -> list[int]:
+    slots = []
+    opening = OPENING_HOUR * 60
+    closing = CLOSING_HOUR * 60
+    position = 0
+    start = opening
+    while start + duration <= closing:
+        end = start + duration
+        # Intervals ending before this slot can never block a later one.
+        while position < len(intervals) and intervals[position][1] <= start:
+            position += 1
+        blocked = False
+        for begin, finish, _ in intervals[position:]:
+            if begin >= end:
+                break
+            if finish > start:
+                blocked = True
+                break
+        if not blocked:
+            slots.append(start)
+        start += SLOT_MINUTES
+    return slots
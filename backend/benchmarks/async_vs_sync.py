@@ -0,0 +1,76 @@
+"""Throughput of the async router path against the old sync Session path.
+
+Run from the backend directory against the database in DATABASE_URL
+(use a real Postgres for meaningful numbers):
+
+    python -m benchmarks.async_vs_sync --requests 5000 --concurrency 200
+
+Both paths serve the same query from the same app; results are printed as
+JSON. SQLite has no network round trip to overlap, so expect the two paths
+to be close there.
+"""
+from fastapi import Depends
+from sqlmodel import Session, select
+from models import User
+from schemas import UserRead
+from database import engine, get_session, init_db, POOL_SIZE, MAX_OVERFLOW
+from benchmarks.harness import asgi_client, measure
+import argparse
+import asyncio
+import json
+import uuid
+
+PAGE_SIZE = 100
+
+
+def seed(users: int) -> None:
+    init_db()
+    with Session(engine) as session:
+        existing = len(session.exec(select(User.id).limit(users)).all())
+        for _ in range(users - existing):
+            session.add(
+                User(
+                    email=f"{uuid.uuid4().hex}@bench.example.com",
+                    hashed_password="-",
+                    name="Bench User",
+                )
+            )
+        session.commit()
+
+
+def build_app():
+    from server import app
+    from routers import users
+
+    # Both paths serialize through the ORM and UserRead, so only the I/O
+    # model differs; the lean path is compared in benchmarks.serialization.
+    users.LEAN_RESPONSES = False
+
+    # The users list is not served from a cache, so both paths hit the DB.
+    @app.get("/bench/sync/users", response_model=list[UserRead])
+    def sync_users(session: Session = Depends(get_session)):
+        return session.exec(select(User).order_by(User.id).limit(PAGE_SIZE)).all()
+
+    return app
+
+
+async def main(args) -> None:
+    seed(args.users)
+    app = build_app()
+    results = {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW, "runs": []}
+    async with asgi_client(app) as client:
+        for path in ("/bench/sync/users", f"/api/users/?limit={PAGE_SIZE}"):
+            send = lambda _, path=path: client.get(path)
+            await measure(path, send, min(args.requests, 100), args.concurrency)
+            results["runs"].append(
+                await measure(path, send, args.requests, args.concurrency)
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--users", type=int, default=PAGE_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,171 @@
+"""Seed the database in DATABASE_URL with a synthetic, reproducible dataset.
+
+    python -m benchmarks.dataset --masters 50 --services 20 --users 10000 \\
+        --appointments 2000000
+
+Rows are written with multi-row INSERTs in batches of --batch-size. Every
+generated user logs in with the password in BENCHMARK_PASSWORD, and
+appointments never overlap per master, so the dataset is valid under the
+booking constraints. On PostgreSQL the monthly partitions covering the
+seeded range are created first, and the report rollups are rebuilt at the
+end. The bookings start in 2020, so serve this database with
+PARTITION_RETENTION_MONTHS=0 or maintenance archives the older months.
+"""
+from sqlalchemy import insert
+from datetime import date, datetime, timedelta
+from models import Appointment, Master, Service, User
+from database import engine, init_db
+from auth import get_password_hash
+from partitions import ensure_partitions
+import rollups
+import argparse
+import json
+import random
+import time
+import uuid
+
+BENCHMARK_PASSWORD = "benchmark"
+BENCHMARK_EMAIL_DOMAIN = "bench.example.com"
+
+SPECIALTIES = ("hair", "nails", "makeup", "massage", "brows")
+DURATIONS = (30, 45, 60, 90)
+FIRST_DAY = datetime(2020, 1, 6, 9, 0)
+SLOT_MINUTES = max(DURATIONS)
+SLOTS_PER_DAY = 8
+
+
+def _batched(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(table, rows, batch_size: int) -> int:
+    count = 0
+    for batch in _batched(rows, batch_size):
+        with engine.begin() as connection:
+            connection.execute(insert(table), batch)
+        count += len(batch)
+    return count
+
+
+def generate(
+    masters: int,
+    services: int,
+    users: int,
+    appointments: int,
+    batch_size: int = 5000,
+    seed: int = 42,
+) -> dict:
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    init_db()
+    started = time.perf_counter()
+
+    master_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(masters)]
+    service_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(services)]
+    user_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(users)]
+    hashed_password = get_password_hash(BENCHMARK_PASSWORD)
+    durations = {service_id: rng.choice(DURATIONS) for service_id in service_ids}
+
+    _insert(Master.__table__, (
+        {
+            "id": master_id,
+            "name": f"Master {index}",
+            "sex": rng.choice("fm"),
+            "phone": f"+7900{seed:03d}{index:07d}",
+            "experience": rng.randint(0, 30),
+            "specialty": rng.choice(SPECIALTIES),
+            "created_at": now,
+        }
+        for index, master_id in enumerate(master_ids)
+    ), batch_size)
+    _insert(Service.__table__, (
+        {
+            "id": service_id,
+            "name": f"Service {seed}-{index}",
+            "description": "Synthetic benchmark service",
+            "price": float(rng.randint(10, 200) * 100),
+            "duration": durations[service_id],
+            "created_at": now,
+        }
+        for index, service_id in enumerate(service_ids)
+    ), batch_size)
+    _insert(User.__table__, (
+        {
+            "id": user_id,
+            "email": f"user{seed}-{index}@{BENCHMARK_EMAIL_DOMAIN}",
+            "hashed_password": hashed_password,
+            "name": f"User {index}",
+            "created_at": now,
+        }
+        for index, user_id in enumerate(user_ids)
+    ), batch_size)
+
+    if engine.dialect.name == "postgresql" and appointments:
+        # Otherwise every seeded month lands in appointments_default.
+        last_slot = (appointments - 1) // max(masters, 1)
+        last_day = (FIRST_DAY + timedelta(days=last_slot // SLOTS_PER_DAY)).date()
+        with engine.begin() as connection:
+            ensure_partitions(
+                connection, max(date.today(), last_day), since=FIRST_DAY.date()
+            )
+
+    def appointment_rows():
+        # Appointment i takes the next free slot of master i % masters, so
+        # a master's bookings never overlap.
+        for index in range(appointments):
+            slot = index // masters
+            service_id = rng.choice(service_ids)
+            start = FIRST_DAY + timedelta(
+                days=slot // SLOTS_PER_DAY,
+                minutes=(slot % SLOTS_PER_DAY) * SLOT_MINUTES,
+            )
+            yield {
+                "id": uuid.UUID(int=rng.getrandbits(128)),
+                "date_time": start,
+                "end_time": start + timedelta(minutes=durations[service_id]),
+                "status": rng.choice(("pending", "confirmed", "completed")),
+                "user_id": rng.choice(user_ids),
+                "master_id": master_ids[index % masters],
+                "service_id": service_id,
+                "created_at": now,
+            }
+
+    _insert(Appointment.__table__, appointment_rows(), batch_size)
+    # Bookings were inserted directly, not through the API's rollup deltas.
+    rollup_rows = rollups.rebuild(engine)
+
+    return {
+        "masters": masters,
+        "services": services,
+        "users": users,
+        "appointments": appointments,
+        "rollup_rows": rollup_rows,
+        "seed": seed,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--masters", type=int, default=50)
+    parser.add_argument("--services", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--appointments", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(generate(
+        args.masters,
+        args.services,
+        args.users,
+        args.appointments,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )))
@@ -0,0 +1,71 @@
+from typing import Awaitable, Callable, Iterable
+import asyncio
+import httpx
+import statistics
+import time
+
+# Admission control turned the request away (overload or rate limit).
+SHED_STATUSES = {429, 503}
+
+
+def asgi_client(app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+    )
+
+
+async def measure(
+    name: str,
+    send: Callable[[int], Awaitable[httpx.Response]],
+    requests: int,
+    concurrency: int,
+    expected: Iterable[int] = (200,),
+) -> dict:
+    # Runs `send(i)` for i in range(requests) with at most `concurrency`
+    # in flight; any status outside `expected` or transport error counts
+    # as an error and is left out of the latency figures. Shed requests
+    # (429/503) are counted separately from errors.
+    expected = set(expected)
+    latencies = []
+    statuses: dict[str, int] = {}
+    errors = shed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> None:
+        nonlocal errors, shed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await send(index)
+            except Exception:
+                errors += 1
+                return
+            elapsed = time.perf_counter() - started
+            key = str(response.status_code)
+            statuses[key] = statuses.get(key, 0) + 1
+            if response.status_code in expected:
+                latencies.append(elapsed)
+            elif response.status_code in SHED_STATUSES:
+                shed += 1
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies or [0.0, 0.0], n=100)
+    return {
+        "name": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "shed": shed,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p95_ms": round(quantiles[94] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+    }
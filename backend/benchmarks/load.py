@@ -0,0 +1,212 @@
+"""Drive the real API routes under concurrent load and report latency.
+
+Seed first with `python -m benchmarks.dataset`, then run from the backend
+directory against the same DATABASE_URL:
+
+    python -m benchmarks.load --requests 2000 --concurrency 64 \\
+        --output run.json
+    python -m benchmarks.load --compare baseline.json --output run.json
+
+Without --base-url the app is served in-process over ASGI. Results are JSON,
+one entry per scenario with throughput and p50/p95/p99 latency; --compare
+exits non-zero when a scenario's p95 or throughput regresses by more than
+--tolerance against a previous run.
+"""
+from sqlmodel import Session, select
+from datetime import datetime, time, timedelta
+from models import Appointment, Master, Service, User
+from database import engine
+from admission import ADMISSION_CONCURRENCY
+from benchmarks.dataset import BENCHMARK_EMAIL_DOMAIN, BENCHMARK_PASSWORD
+from benchmarks.harness import asgi_client, measure
+import argparse
+import asyncio
+import httpx
+import json
+import platform
+import random
+import sys
+
+SAMPLE_SIZE = 1000
+
+
+def sample_ids() -> dict:
+    with Session(engine) as session:
+        def ids(statement):
+            return session.exec(statement.limit(SAMPLE_SIZE)).all()
+
+        return {
+            "masters": ids(select(Master.id)),
+            "services": ids(select(Service.id)),
+            "appointments": ids(
+                select(
+                    Appointment.id,
+                    Appointment.master_id,
+                    Appointment.user_id,
+                    Appointment.service_id,
+                    Appointment.date_time,
+                ).order_by(Appointment.date_time.desc())
+            ),
+            "emails": ids(
+                select(User.email).where(
+                    User.email.like(f"%@{BENCHMARK_EMAIL_DOMAIN}")
+                )
+            ),
+        }
+
+
+def scenarios(client: httpx.AsyncClient, ids: dict, rng: random.Random) -> dict:
+    appointments = ids["appointments"]
+    # Starts after the latest booking in the database, including those made
+    # by earlier runs, so repeated runs never collide.
+    latest = max(appointments[0][4], datetime.now())
+    fresh_start = datetime.combine(latest.date() + timedelta(days=2), time.min)
+
+    def pick(name):
+        return rng.choice(ids[name])
+
+    def create_fresh(index):
+        _, master_id, user_id, service_id, _ = rng.choice(appointments)
+        return client.post("/api/appointments/", json={
+            "date_time": (fresh_start + timedelta(hours=index * 3)).isoformat(),
+            "user_id": str(user_id),
+            "master_id": str(master_id),
+            "service_id": str(service_id),
+        })
+
+    def create_conflict(_):
+        _, master_id, user_id, service_id, date_time = rng.choice(appointments)
+        return client.post("/api/appointments/", json={
+            "date_time": date_time.isoformat(),
+            "user_id": str(user_id),
+            "master_id": str(master_id),
+            "service_id": str(service_id),
+        })
+
+    def update(_):
+        appointment_id = rng.choice(appointments)[0]
+        status = rng.choice(("pending", "confirmed"))
+        return client.put(f"/api/appointments/{appointment_id}", json={"status": status})
+
+    return {
+        "list_appointments": (
+            lambda _: client.get("/api/appointments/", params={"limit": 100}),
+            (200,),
+        ),
+        "list_appointments_by_master": (
+            lambda _: client.get(
+                "/api/appointments/",
+                params={"master_id": str(pick("masters")), "limit": 100},
+            ),
+            (200,),
+        ),
+        "list_masters": (lambda _: client.get("/api/masters/"), (200,)),
+        "list_services": (lambda _: client.get("/api/services/"), (200,)),
+        "get_master": (
+            lambda _: client.get(f"/api/masters/{pick('masters')}"),
+            (200,),
+        ),
+        "get_service": (
+            lambda _: client.get(f"/api/services/{pick('services')}"),
+            (200,),
+        ),
+        "get_appointment": (
+            lambda _: client.get(f"/api/appointments/{rng.choice(appointments)[0]}"),
+            (200,),
+        ),
+        "create_appointment": (create_fresh, (201,)),
+        "create_appointment_conflict": (create_conflict, (400,)),
+        "update_appointment": (update, (200,)),
+        "login": (
+            lambda _: client.post("/api/users/login/", json={
+                "email": pick("emails"),
+                "password": BENCHMARK_PASSWORD,
+            }),
+            (200,),
+        ),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    previous = {run["name"]: run for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        before = previous.get(run["name"])
+        if before is None:
+            continue
+        if run["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{run['name']}: p95 {before['p95_ms']}ms -> {run['p95_ms']}ms"
+            )
+        if run["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{run['name']}: throughput {before['rps']} -> {run['rps']} rps"
+            )
+    return regressions
+
+
+async def main(args) -> int:
+    ids = sample_ids()
+    if not ids["appointments"] or not ids["emails"]:
+        sys.exit("No benchmark data found; run python -m benchmarks.dataset first")
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        from server import app
+        client = asgi_client(app)
+
+    rng = random.Random(args.seed)
+    selected = set(args.scenario or [])
+    results = {
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "runs": [],
+    }
+    async with client:
+        for name, (send, expected) in scenarios(client, ids, rng).items():
+            if selected and name not in selected:
+                continue
+            requests, concurrency = args.requests, args.concurrency
+            if name == "login":
+                requests = max(1, args.requests // args.login_divisor)
+                # More logins in flight than admission allows are shed with
+                # 503 instead of measuring bcrypt.
+                concurrency = min(concurrency, args.login_concurrency)
+            results["runs"].append(
+                await measure(name, send, requests, concurrency, expected)
+            )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output)
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--scenario", action="append", help="run only this scenario")
+    parser.add_argument("--login-divisor", type=int, default=10,
+                        help="login runs requests / divisor times (bcrypt is slow)")
+    parser.add_argument("--login-concurrency", type=int,
+                        default=int(ADMISSION_CONCURRENCY.get("login", 64)),
+                        help="cap on logins in flight (default: the admission limit)")
+    parser.add_argument("--base-url", help="benchmark a running server instead")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    sys.exit(asyncio.run(main(parser.parse_args())))
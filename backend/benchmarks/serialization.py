@@ -0,0 +1,55 @@
+"""Rows/second of the appointments list with and without the lean path.
+
+Seed first with `python -m benchmarks.dataset`, then run from the backend
+directory against the same DATABASE_URL:
+
+    python -m benchmarks.serialization --limit 1000 --requests 200
+
+Each page is served three ways from the same app: through the ORM and
+response_model validation (LEAN_RESPONSES=false), through the lean column
+select + orjson path, and lean with ?fields=id,date_time. Responses are
+requested uncompressed unless --gzip is given, so the figures compare
+serialization rather than compression. Results are printed as JSON.
+"""
+from benchmarks.harness import asgi_client, measure
+import argparse
+import asyncio
+import json
+
+MODES = (
+    ("validated", False, ""),
+    ("lean", True, ""),
+    ("lean_fields", True, "&fields=id,date_time"),
+)
+
+
+async def main(args) -> None:
+    from server import app
+    from routers import appointments
+
+    headers = {} if args.gzip else {"Accept-Encoding": "identity"}
+    results = {"limit": args.limit, "gzip": args.gzip, "runs": []}
+    async with asgi_client(app) as client:
+        for name, lean, query in MODES:
+            appointments.LEAN_RESPONSES = lean
+            path = f"/api/appointments/?limit={args.limit}{query}"
+            send = lambda _, path=path: client.get(path, headers=headers)
+
+            first = await send(0)
+            rows = len(first.json())
+            await measure(name, send, min(args.requests, 20), args.concurrency)
+            run = await measure(name, send, args.requests, args.concurrency)
+            run["rows_per_page"] = rows
+            run["bytes_per_page"] = len(first.content)
+            run["rows_per_second"] = round(run["rps"] * rows, 1)
+            results["runs"].append(run)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--gzip", action="store_true")
+    asyncio.run(main(parser.parse_args()))
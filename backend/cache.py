@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+import asyncio
+import threading
+import time
+
+
+class TTLCache:
+    # Bounded LRU mapping whose entries also expire after a per-entry TTL.
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class Generation:
+    # Write counter guarding a read-through cache: a loader notes `value`
+    # before it reads, and stores the result only if `unchanged_since` that
+    # value; a write that landed mid-load makes it serve the result once,
+    # uncached.
+    def __init__(self):
+        self.value = 0
+
+    def advance(self) -> None:
+        self.value += 1
+
+    def unchanged_since(self, value: int) -> bool:
+        return value == self.value
+
+
+class SingleFlight:
+    # Concurrent calls for the same key share one running load. The load
+    # runs as its own task, so a caller that disconnects does not cancel it
+    # for the others.
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._finish(key, task))
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable) -> None:
+        # Later callers start a new load instead of joining the running one.
+        self._calls.pop(key, None)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -0,0 +1,136 @@
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Awaitable, Callable, Hashable, NamedTuple, Optional
+from cache import Generation, SingleFlight, TTLCache
+from database import async_engine
+from pagination import NEXT_CURSOR_HEADER
+from repository import Repository, master_repository, service_repository
+from schemas import MasterRead, ServiceRead
+import hashlib
+import os
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "256"))
+# Short on purpose: other workers' writes only show up once it expires.
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "1"))
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", "10000"))
+
+
+class CatalogPage(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+
+
+def _page(body: bytes, next_cursor: Optional[str] = None) -> CatalogPage:
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return CatalogPage(body, etag, next_cursor)
+
+
+class CatalogCache:
+    # Read-through cache of serialized catalog pages. Writes in this process
+    # invalidate it immediately; CATALOG_CACHE_TTL bounds how long other
+    # workers can serve a page that predates a write.
+    def __init__(self, schema, ttl: float = CATALOG_CACHE_TTL):
+        self._adapter = TypeAdapter(list[schema])
+        self._pages = TTLCache(CATALOG_CACHE_SIZE, ttl)
+        self._generation = Generation()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[], Awaitable[tuple[list, Optional[str]]]],
+    ) -> CatalogPage:
+        page = self._pages.get(key)
+        if page is not None:
+            return page
+
+        generation = self._generation.value
+        rows, next_cursor = await load()
+        body = self._adapter.dump_json(
+            self._adapter.validate_python(rows, from_attributes=True)
+        )
+        page = _page(body, next_cursor)
+
+        if self._generation.unchanged_since(generation):
+            self._pages.set(key, page)
+        return page
+
+    def invalidate(self) -> None:
+        self._generation.advance()
+        self._pages.clear()
+
+
+class RecordCache:
+    # By-id reads of one catalog model. Concurrent requests for the same id
+    # share one query and its serialized body (single-flight), which then
+    # stays cached for RECORD_CACHE_TTL seconds; writes in this process
+    # drop it immediately.
+    def __init__(self, repository: Repository, schema):
+        self.repository = repository
+        self._adapter = TypeAdapter(schema)
+        self._records = TTLCache(RECORD_CACHE_SIZE, RECORD_CACHE_TTL)
+        self._flights = SingleFlight()
+        self._generation = Generation()
+        self.stats = {"hit": 0, "shared": 0, "load": 0}
+
+    async def get(self, id: str) -> CatalogPage:
+        page = self._records.get(id)
+        if page is not None:
+            self.stats["hit"] += 1
+            return page
+
+        self.stats["shared" if self._flights.in_flight(id) else "load"] += 1
+        return await self._flights.do(id, lambda: self._load(id))
+
+    async def _load(self, id: str) -> CatalogPage:
+        generation = self._generation.value
+        # Its own session: the load outlives the request that started it
+        # when that client disconnects. Read from the primary, like every
+        # cached value, so a lagging replica cannot re-cache an old row.
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            obj = await self.repository.get(session, id)
+        page = _page(
+            self._adapter.dump_json(
+                self._adapter.validate_python(obj, from_attributes=True)
+            )
+        )
+
+        if self._generation.unchanged_since(generation):
+            self._records.set(id, page)
+        return page
+
+    def invalidate(self, id) -> None:
+        self._generation.advance()
+        self._records.pop(id)
+        self._flights.forget(id)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip() for candidate in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def catalog_response(request: Request, page: CatalogPage) -> Response:
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if page.next_cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = page.next_cursor
+
+    if _etag_matches(request, page.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=page.body,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+master_catalog = CatalogCache(MasterRead)
+service_catalog = CatalogCache(ServiceRead)
+master_records = RecordCache(master_repository, MasterRead)
+service_records = RecordCache(service_repository, ServiceRead)
@@ -1,5 +1,12 @@
-from sqlmodel import create_engine, Session, SQLModel
-from typing import Generator
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from typing import AsyncGenerator, Generator, Optional
+import asyncio
+import itertools
+import logging
 import os
 
 DB_URL = os.getenv(
@@ -7,22 +14,163 @@ DB_URL = os.getenv(
     "postgresql://postgres:postgres@db:5432/salon_natasha",
 )
 
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Comma-separated replica URLs; GET handlers read from them when set.
+READ_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_READ_URL", "").split(",")
+    if url.strip()
+]
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(POOL_SIZE)))
+READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", str(MAX_OVERFLOW)))
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", "2"))
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_DB_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DB_URL))
+
 engine = create_engine(
     DB_URL,
     echo=False,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
 )
 
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+)
+
+
+def _enforce_sqlite_foreign_keys(engine: Engine) -> None:
+    # SQLite ignores ON DELETE rules unless foreign keys are switched on for
+    # every connection.
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+_enforce_sqlite_foreign_keys(engine)
+_enforce_sqlite_foreign_keys(async_engine.sync_engine)
+
+
+class ReplicaSet:
+    # Round-robin over the replicas that passed their last health check.
+    # With none configured, or none healthy, reads go to the primary.
+    def __init__(self, urls: list[str], primary: AsyncEngine):
+        self.primary = primary
+        self.engines = [
+            create_async_engine(
+                _async_url(url),
+                echo=False,
+                pool_pre_ping=True,
+                pool_size=READ_POOL_SIZE,
+                max_overflow=READ_MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+            )
+            for url in urls
+        ]
+        for replica in self.engines:
+            _enforce_sqlite_foreign_keys(replica.sync_engine)
+        self.healthy = [True] * len(self.engines)
+        self._turn = itertools.count()
+        self._monitor: Optional[asyncio.Task] = None
+
+    def engine(self) -> AsyncEngine:
+        candidates = [
+            replica
+            for replica, healthy in zip(self.engines, self.healthy)
+            if healthy
+        ]
+        if not candidates:
+            return self.primary
+        return candidates[next(self._turn) % len(candidates)]
+
+    async def check(self) -> None:
+        for index, replica in enumerate(self.engines):
+            try:
+                await asyncio.wait_for(_ping(replica), REPLICA_CHECK_TIMEOUT)
+                healthy = True
+            except Exception as exc:
+                healthy = False
+                if self.healthy[index]:
+                    logger.warning(f"Read replica {index} failed health check: {exc}")
+            if healthy and not self.healthy[index]:
+                logger.info(f"Read replica {index} is healthy again")
+            self.healthy[index] = healthy
+
+    async def _watch(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    def start(self) -> None:
+        if self.engines and self._monitor is None:
+            self._monitor = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for replica in self.engines:
+            await replica.dispose()
+
+
+async def _ping(engine: AsyncEngine) -> None:
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+replicas = ReplicaSet(READ_URLS, async_engine)
+
 
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
 
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    # For handlers that tolerate replication lag. Writes, and reads that must
+    # see the caller's own writes, use get_async_session instead.
+    async with AsyncSession(replicas.engine(), expire_on_commit=False) as session:
+        yield session
+
 
+def init_db() -> int:
+    # Imported on use: migrations pulls in the app modules with flat
+    # imports, which `import backend` cannot resolve.
+    from migrations import migrate
 
-    
\ No newline at end of file
+    return migrate(engine)
@@ -0,0 +1,293 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, NamedTuple, Optional
+from auth import forget_user, token_cache
+from availability import occupancy
+from models import CANCELLED_STATUSES
+from schemas import AppointmentRead
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+EVENTS_CHANNEL = "appointment_events"
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_RECONNECT_DELAY = 1.0
+# NOTIFY payloads are limited to 8000 bytes; a slot takes about 55.
+RESET_SLOTS_PER_EVENT = 100
+
+logger = logging.getLogger(__name__)
+
+
+class FeedEvent(NamedTuple):
+    kind: str
+    # (master_id, day) pairs the event concerns; an update that moves a
+    # booking lists both the old and the new slot.
+    slots: frozenset
+    frame: bytes
+    message: dict
+
+
+class Subscriber:
+    def __init__(self, master_id: Optional[uuid.UUID], day: Optional[date]):
+        self.master_id = master_id
+        self.day = day
+        self.queue: asyncio.Queue[FeedEvent] = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event: FeedEvent) -> bool:
+        if not event.slots:
+            return True
+        return any(
+            (self.master_id is None or master_id == self.master_id)
+            and (self.day is None or day == self.day)
+            for master_id, day in event.slots
+        )
+
+
+def _slot(master_id, date_time) -> tuple[uuid.UUID, date]:
+    if isinstance(master_id, str):
+        master_id = uuid.UUID(master_id)
+    if isinstance(date_time, str):
+        date_time = datetime.fromisoformat(date_time)
+    if isinstance(date_time, datetime):
+        date_time = date_time.date()
+    return master_id, date_time
+
+
+def _event(message: dict) -> FeedEvent:
+    slots = {_slot(master_id, day) for master_id, day in message.get("slots", ())}
+    for snapshot in (message.get("appointment"), message.get("previous")):
+        if snapshot:
+            slots.add(_slot(snapshot["master_id"], snapshot["date_time"]))
+    data = json.dumps(
+        {key: value for key, value in message.items() if key != "origin"},
+        separators=(",", ":"),
+    )
+    frame = f"event: {message['type']}\ndata: {data}\n\n".encode()
+    return FeedEvent(message["type"], frozenset(slots), frame, message)
+
+
+class AppointmentFeed:
+    # Fans appointment changes out to the SSE subscribers of every worker.
+    # Events are delivered locally right away; on Postgres they are also
+    # sent with NOTIFY, and each worker LISTENs for the others' events.
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.engine: Optional[AsyncEngine] = None
+        self._subscribers: set[Subscriber] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def distributed(self) -> bool:
+        return self.engine is not None and self.engine.dialect.name == "postgresql"
+
+    def subscribe(
+        self, master_id: Optional[uuid.UUID], day: Optional[date]
+    ) -> Subscriber:
+        subscriber = Subscriber(master_id, day)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def publish(
+        self,
+        kind: str,
+        appointment=None,
+        previous: Optional[tuple[uuid.UUID, datetime]] = None,
+    ) -> None:
+        await self.publish_many([(kind, appointment, previous)])
+
+    def message(
+        self,
+        kind: str,
+        appointment=None,
+        previous: Optional[tuple[uuid.UUID, datetime]] = None,
+    ) -> dict:
+        message = {"type": kind, "origin": self.origin}
+        if appointment is not None:
+            message["appointment"] = AppointmentRead.model_validate(
+                appointment
+            ).model_dump(mode="json")
+        if previous is not None:
+            master_id, date_time = previous
+            message["previous"] = {
+                "master_id": str(master_id),
+                "date_time": date_time.isoformat(),
+            }
+        return message
+
+    async def publish_many(self, changes: Iterable[tuple]) -> None:
+        # Nothing is serialized when no one can receive the events.
+        if not self.distributed and not self._subscribers:
+            return
+
+        messages = [self.message(*change) for change in changes]
+        for message in messages:
+            self._deliver(_event(message))
+
+        await self._notify(messages)
+
+    async def reset(self, slots: Iterable[tuple[uuid.UUID, date]]) -> None:
+        # Bookings on these (master, day) slots changed without per-booking
+        # events, e.g. when a user is deleted with their appointments.
+        # Their subscribers reload and other workers drop those days.
+        slots = sorted(slots)
+        if not slots or (not self.distributed and not self._subscribers):
+            return
+
+        messages = [
+            {
+                "type": "reset",
+                "origin": self.origin,
+                "slots": [
+                    [str(master_id), day.isoformat()]
+                    for master_id, day in slots[start:start + RESET_SLOTS_PER_EVENT]
+                ],
+            }
+            for start in range(0, len(slots), RESET_SLOTS_PER_EVENT)
+        ]
+        for message in messages:
+            self._deliver(_event(message))
+
+        await self._notify(messages)
+
+    async def forget_user(self, user_id: uuid.UUID) -> None:
+        # A deleted user's tokens stay in every worker's token cache; the
+        # others drop them when this reaches them. Not sent to subscribers.
+        forget_user(user_id)
+        await self._notify([
+            {"type": "user_deleted", "origin": self.origin, "user_id": str(user_id)}
+        ])
+
+    async def _notify(self, messages: list[dict]) -> None:
+        if not self.distributed or not messages:
+            return
+
+        try:
+            async with self.engine.begin() as connection:
+                await connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    [
+                        {"channel": EVENTS_CHANNEL, "payload": json.dumps(message)}
+                        for message in messages
+                    ],
+                )
+        except Exception as exc:
+            # The write already committed; other workers miss this event.
+            logger.warning(f"Failed to publish appointment events: {exc}")
+
+    def _deliver(self, event: FeedEvent) -> None:
+        for subscriber in list(self._subscribers):
+            if subscriber.overflowed or not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A stalled client; end its stream rather than buffer more.
+                subscriber.overflowed = True
+
+    def _receive(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message.get("origin") == self.origin:
+            return
+        if message["type"] == "user_deleted":
+            forget_user(uuid.UUID(message["user_id"]))
+            return
+
+        # Keep this worker's occupancy index in step with writes made by
+        # the others.
+        appointment = message.get("appointment")
+        if message["type"] == "reset":
+            event = _event(message)
+            if event.slots:
+                occupancy.discard_days(event.slots)
+            else:
+                occupancy.clear()
+            self._deliver(event)
+            return
+        elif appointment is not None:
+            parsed = AppointmentRead.model_validate(appointment)
+            if message["type"] == "deleted" or parsed.status in CANCELLED_STATUSES:
+                occupancy.discard(parsed.id)
+            else:
+                occupancy.add(
+                    parsed.id, parsed.master_id, parsed.date_time, parsed.end_time
+                )
+
+        self._deliver(_event(message))
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        try:
+            yield b": connected\n\n"
+            while not subscriber.overflowed:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), EVENTS_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield event.frame
+            # Events were dropped; the client must reload before resuming.
+            yield b"event: reset\ndata: {}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.engine.connect() as connection:
+                    await self._listen_on(connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Appointment event listener disconnected: {exc}")
+            # Anything sent while disconnected is lost, so stale schedules
+            # and tokens of possibly deleted users are dropped, and screens
+            # told to reload.
+            occupancy.clear()
+            token_cache.clear()
+            self._deliver(_event({"type": "reset"}))
+            await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+
+    async def _listen_on(self, connection: AsyncConnection) -> None:
+        raw = await connection.get_raw_connection()
+        driver = raw.driver_connection
+        closed = asyncio.Event()
+
+        def on_notify(_connection, _pid, _channel, payload):
+            try:
+                self._receive(payload)
+            except Exception as exc:
+                logger.warning(f"Bad appointment event: {exc}")
+
+        driver.add_termination_listener(lambda _connection: closed.set())
+        await driver.add_listener(EVENTS_CHANNEL, on_notify)
+        logger.info(f"Listening for appointment events on {EVENTS_CHANNEL}")
+        try:
+            await closed.wait()
+        finally:
+            if not driver.is_closed():
+                await driver.remove_listener(EVENTS_CHANNEL, on_notify)
+
+    def start(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        if self.distributed and self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+
+appointment_feed = AppointmentFeed()
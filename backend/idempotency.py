@@ -0,0 +1,214 @@
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from cache import TTLCache
+from database import async_engine
+from models import IdempotencyKey
+import hashlib
+import os
+import time
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How long a key stays reserved by a request that never finishes (crash,
+# lost worker) before a retry may run the write again.
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "false").lower() in ("1", "true", "yes")
+IDEMPOTENCY_PURGE_INTERVAL = 300.0
+MAX_KEY_LENGTH = 255
+
+# create_user, create_master, create_service and create_appointment.
+IDEMPOTENT_PATHS = frozenset({
+    "/api/users/",
+    "/api/masters/",
+    "/api/services/",
+    "/api/appointments/",
+})
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: Optional[int]
+    body: bytes
+
+
+class MemoryStore:
+    # Per-process store; a retry that lands on another worker runs again.
+    def __init__(self):
+        self._entries = TTLCache(IDEMPOTENCY_CACHE_SIZE)
+
+    async def reserve(
+        self, route: str, key: str, request_hash: str
+    ) -> Optional[StoredResponse]:
+        # No await between the lookup and the insert, so this is atomic on
+        # the event loop.
+        existing = self._entries.get((route, key))
+        if existing is not None:
+            return existing
+        self._entries.set(
+            (route, key),
+            StoredResponse(request_hash, None, b""),
+            ttl=IDEMPOTENCY_LOCK_TIMEOUT,
+        )
+        return None
+
+    async def complete(
+        self, route: str, key: str, request_hash: str, status_code: int, body: bytes
+    ) -> None:
+        self._entries.set(
+            (route, key),
+            StoredResponse(request_hash, status_code, body),
+            ttl=IDEMPOTENCY_TTL,
+        )
+
+    async def release(self, route: str, key: str) -> None:
+        self._entries.pop((route, key))
+
+
+class DatabaseStore:
+    # Shared by every worker through the idempotency_keys table, so retries
+    # are replayed whichever worker they reach.
+    def __init__(self, engine):
+        self.engine = engine
+        self._purged_at = 0.0
+
+    def _insert(self):
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            return postgresql.insert(IdempotencyKey).on_conflict_do_nothing()
+        if dialect == "sqlite":
+            return sqlite.insert(IdempotencyKey).on_conflict_do_nothing()
+        return insert(IdempotencyKey)
+
+    def _where(self, route: str, key: str):
+        return (IdempotencyKey.route == route, IdempotencyKey.key == key)
+
+    async def reserve(
+        self, route: str, key: str, request_hash: str
+    ) -> Optional[StoredResponse]:
+        now = datetime.utcnow()
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                delete(IdempotencyKey).where(
+                    *self._where(route, key), IdempotencyKey.expires_at <= now
+                )
+            )
+            result = await connection.execute(
+                self._insert().values(
+                    route=route,
+                    key=key,
+                    request_hash=request_hash,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT),
+                )
+            )
+            if result.rowcount == 1:
+                return None
+
+            row = (
+                await connection.execute(
+                    select(
+                        IdempotencyKey.request_hash,
+                        IdempotencyKey.status_code,
+                        IdempotencyKey.body,
+                    ).where(*self._where(route, key))
+                )
+            ).first()
+
+        if row is None:
+            # The holder released the key in between; let the caller run.
+            return await self.reserve(route, key, request_hash)
+        return StoredResponse(row.request_hash, row.status_code, row.body or b"")
+
+    async def complete(
+        self, route: str, key: str, request_hash: str, status_code: int, body: bytes
+    ) -> None:
+        now = datetime.utcnow()
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                update(IdempotencyKey)
+                .where(*self._where(route, key))
+                .values(
+                    status_code=status_code,
+                    body=body,
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL),
+                )
+            )
+            if time.monotonic() - self._purged_at >= IDEMPOTENCY_PURGE_INTERVAL:
+                self._purged_at = time.monotonic()
+                await connection.execute(
+                    delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now)
+                )
+
+    async def release(self, route: str, key: str) -> None:
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                delete(IdempotencyKey).where(*self._where(route, key))
+            )
+
+
+store = DatabaseStore(async_engine) if IDEMPOTENCY_DB else MemoryStore()
+
+stats = {"replayed": 0, "conflicts": 0}
+
+
+async def handle_idempotent_post(request: Request, call_next) -> Response:
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    route = request.url.path
+
+    if request.method != "POST" or key is None or route not in IDEMPOTENT_PATHS:
+        return await call_next(request)
+
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return JSONResponse(
+            {"detail": f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} chars"},
+            status_code=400,
+        )
+
+    request_hash = hashlib.sha256(await request.body()).hexdigest()
+    stored = await store.reserve(route, key, request_hash)
+
+    if stored is not None:
+        if stored.request_hash != request_hash:
+            stats["conflicts"] += 1
+            detail = f"{IDEMPOTENCY_HEADER} was already used with another request"
+            return JSONResponse({"detail": detail}, status_code=422)
+        if stored.status_code is None:
+            stats["conflicts"] += 1
+            detail = f"A request with this {IDEMPOTENCY_HEADER} is in progress"
+            return JSONResponse(
+                {"detail": detail}, status_code=409, headers={"Retry-After": "1"}
+            )
+        stats["replayed"] += 1
+        return Response(
+            stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except BaseException:
+        await store.release(route, key)
+        raise
+
+    # Server errors are not a final answer; the retry should run again.
+    if response.status_code >= 500:
+        await store.release(route, key)
+    else:
+        await store.complete(route, key, request_hash, response.status_code, body)
+
+    return Response(
+        body,
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        media_type=response.media_type,
+    )
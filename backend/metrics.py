@@ -0,0 +1,187 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Optional
+import bisect
+import logging
+import os
+import threading
+import time
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_time")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_name(self.scope)
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+def route_name(scope: dict) -> str:
+    # The route template, not the raw path, keeps label cardinality bounded.
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: dict[tuple[str, str, str], Histogram] = {}
+        self._db_queries: dict[str, int] = {}
+        self._db_seconds: dict[str, float] = {}
+        self._slow_queries: dict[str, int] = {}
+        self._collectors = []
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        stats: RequestStats,
+    ) -> None:
+        key = (method, route, str(status))
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            self._db_queries[route] = self._db_queries.get(route, 0) + stats.queries
+            self._db_seconds[route] = self._db_seconds.get(route, 0.0) + stats.db_time
+
+    def observe_slow_query(self, route: str) -> None:
+        with self._lock:
+            self._slow_queries[route] = self._slow_queries.get(route, 0) + 1
+
+    def add_collector(self, collect) -> None:
+        # `collect()` returns (name, type, help, [(labels, value), ...]) tuples
+        # rendered alongside the built-in metrics.
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        with self._lock:
+            lines.append(
+                "# HELP http_request_duration_seconds Request latency by route."
+            )
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route, status), histogram in sorted(self._latency.items()):
+                labels = {"method": method, "route": route, "status": status}
+                cumulative = 0
+                for bound, count in zip(
+                    (*histogram.buckets, "+Inf"), histogram.counts
+                ):
+                    cumulative += count
+                    lines.append(
+                        "http_request_duration_seconds_bucket"
+                        f"{_labels({**labels, 'le': bound})} {cumulative}"
+                    )
+                lines.append(
+                    f"http_request_duration_seconds_sum{_labels(labels)} "
+                    f"{histogram.total}"
+                )
+                lines.append(
+                    f"http_request_duration_seconds_count{_labels(labels)} "
+                    f"{histogram.count}"
+                )
+
+            family(
+                "db_queries_total", "counter", "SQL statements issued by route.",
+                [({"route": r}, v) for r, v in sorted(self._db_queries.items())],
+            )
+            family(
+                "db_query_seconds_total", "counter", "Time spent in SQL by route.",
+                [({"route": r}, v) for r, v in sorted(self._db_seconds.items())],
+            )
+            family(
+                "db_slow_queries_total", "counter",
+                f"SQL statements slower than {SLOW_QUERY_MS} ms by route.",
+                [({"route": r}, v) for r, v in sorted(self._slow_queries.items())],
+            )
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                family(name, kind, help_text, samples)
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+registry = Registry()
+
+
+def instrument_engine(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's context rather than the connection, so a
+        # failed statement (no after_cursor_execute) leaves nothing behind.
+        if context is not None:
+            context.query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats = current_request.get()
+        route = stats.route if stats is not None else "background"
+
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            registry.observe_slow_query(route)
+            logger.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms) on {route}: {statement}"
+            )
+
+
+def server_timing(stats: RequestStats, seconds: float) -> str:
+    return (
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", '
+        f"app;dur={seconds * 1000:.2f}"
+    )
@@ -0,0 +1,381 @@
+"""Versioned schema migrations.
+
+    python migrations.py          # bring DATABASE_URL up to date
+    python migrations.py --check  # exit 1 if the schema is not current
+
+A fresh database is created from the models and stamped with the latest
+version. A database created by an older release that has no schema_version
+table is treated as version 1 and upgraded step by step.
+"""
+from sqlalchemy import (
+    Column,
+    bindparam,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlmodel import SQLModel
+from models import (
+    CANCELLED_STATUSES,
+    OVERLAP_CONSTRAINT,
+    Appointment,
+    AppointmentRollup,
+    IdempotencyKey,
+    Master,
+    Service,
+)
+from partitions import ensure_partitions, overlap_constraint_sql
+from rollups import rebuild_on
+from datetime import date
+from typing import Optional
+import argparse
+import hashlib
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Kept out of SQLModel.metadata so the fingerprint only covers app tables.
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+# Serializes migrations when several workers start against the same database.
+MIGRATION_LOCK_ID = 4_180_512
+# Migration 2 finds bookings that overlap an earlier one of the same master,
+# which older releases accepted. By default it stops and reports them; true
+# cancels the later booking of each overlap instead.
+MIGRATION_CANCEL_OVERLAPS = os.getenv(
+    "MIGRATION_CANCEL_OVERLAPS", "false"
+).lower() in ("1", "true", "yes")
+# Overlaps listed in the log when migration 2 stops.
+OVERLAP_REPORT_LIMIT = 20
+
+
+class SchemaMismatch(RuntimeError):
+    pass
+
+
+def schema_fingerprint(engine: Engine) -> str:
+    # Hash of the DDL the models compile to on this dialect; it changes
+    # whenever a model changes, with or without a matching migration.
+    dialect = engine.dialect
+    statements = []
+    for table in SQLModel.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            statements.append(str(CreateIndex(index).compile(dialect=dialect)))
+    digest = hashlib.sha256("\n".join(statements).encode())
+    return digest.hexdigest()[:16]
+
+
+def _index(table, name: str):
+    return next(index for index in table.indexes if index.name == name)
+
+
+def _has_constraint(connection: Connection, name: str) -> bool:
+    statement = text("SELECT 1 FROM pg_constraint WHERE conname = :name")
+    return connection.execute(statement, {"name": name}).first() is not None
+
+
+def _overlapping_bookings(connection: Connection) -> list:
+    # (id, master_id, date_time, id of the earlier booking it overlaps) for
+    # every active booking that has to go for the exclusion constraint to
+    # hold: per master in start order, each booking clashing with one kept
+    # before it. Only masters with an overlap are read.
+    cancelled = {"cancelled": list(CANCELLED_STATUSES)}
+    statement = text(
+        "SELECT id, master_id, date_time, end_time FROM appointments"
+        " WHERE status NOT IN :cancelled AND master_id IN ("
+        "  SELECT a.master_id FROM appointments a JOIN appointments b"
+        "  ON b.master_id = a.master_id AND b.id <> a.id"
+        "  AND b.date_time < a.end_time AND b.end_time > a.date_time"
+        "  WHERE a.status NOT IN :cancelled AND b.status NOT IN :cancelled)"
+        " ORDER BY master_id, date_time, id"
+    ).bindparams(bindparam("cancelled", expanding=True))
+
+    overlaps = []
+    kept_master, kept_id, kept_end = None, None, None
+    for row in connection.execute(statement, cancelled):
+        if row.master_id == kept_master and row.date_time < kept_end:
+            overlaps.append((row.id, row.master_id, row.date_time, kept_id))
+            continue
+        if row.master_id != kept_master or row.end_time > kept_end:
+            kept_master, kept_id, kept_end = row.master_id, row.id, row.end_time
+    return overlaps
+
+
+def _resolve_overlaps(connection: Connection) -> None:
+    overlaps = _overlapping_bookings(connection)
+    if not overlaps:
+        return
+
+    if not MIGRATION_CANCEL_OVERLAPS:
+        for booking_id, master_id, start, earlier_id in overlaps[:OVERLAP_REPORT_LIMIT]:
+            logger.error(
+                f"Appointment {booking_id} (master {master_id}, {start})"
+                f" overlaps appointment {earlier_id}"
+            )
+        raise SchemaMismatch(
+            f"{len(overlaps)} appointments overlap an earlier booking of the same"
+            " master; fix them or rerun with MIGRATION_CANCEL_OVERLAPS=true to"
+            " cancel the later booking of each overlap"
+        )
+
+    connection.execute(
+        text("UPDATE appointments SET status = 'cancelled' WHERE id IN :ids")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": [booking_id for booking_id, *_ in overlaps]},
+    )
+    logger.warning(f"Cancelled {len(overlaps)} overlapping appointments")
+
+
+def _scheduling(connection: Connection) -> None:
+    # Stored end_time, the overlap exclusion constraint and the indexes
+    # behind filtered lists and keyset pagination.
+    appointments = Appointment.__table__
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    connection.execute(text(
+        "ALTER TABLE appointments ADD COLUMN IF NOT EXISTS end_time TIMESTAMP"
+    ))
+    connection.execute(text(
+        "UPDATE appointments SET end_time = appointments.date_time"
+        " + services.duration * INTERVAL '1 minute'"
+        " FROM services WHERE services.id = appointments.service_id"
+        " AND appointments.end_time IS NULL"
+    ))
+    connection.execute(text(
+        "ALTER TABLE appointments ALTER COLUMN end_time SET NOT NULL"
+    ))
+    for name in (
+        "ix_appointments_date_time_id",
+        "ix_appointments_master_id_date_time",
+        "ix_appointments_user_id_date_time",
+        "ix_appointments_status_date_time",
+    ):
+        _index(appointments, name).create(connection, checkfirst=True)
+    _index(Master.__table__, "ix_masters_specialty_id").create(
+        connection, checkfirst=True
+    )
+    if not _has_constraint(connection, OVERLAP_CONSTRAINT):
+        _resolve_overlaps(connection)
+        connection.execute(
+            text(overlap_constraint_sql("appointments", OVERLAP_CONSTRAINT))
+        )
+
+
+def _archiving(connection: Connection) -> None:
+    # Soft-deleted masters and services, uniqueness over active rows only,
+    # and delete rules enforced by the database.
+    for table in ("masters", "services"):
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP"
+        ))
+    connection.execute(text("DROP INDEX IF EXISTS ix_masters_phone"))
+    connection.execute(text(
+        "ALTER TABLE services DROP CONSTRAINT IF EXISTS services_name_key"
+    ))
+    _index(Master.__table__, "uq_masters_phone_active").create(
+        connection, checkfirst=True
+    )
+    _index(Service.__table__, "uq_services_name_active").create(
+        connection, checkfirst=True
+    )
+    for column, target, rule in (
+        ("user_id", "users", "CASCADE"),
+        ("master_id", "masters", "RESTRICT"),
+        ("service_id", "services", "RESTRICT"),
+    ):
+        constraint = f"appointments_{column}_fkey"
+        connection.execute(text(
+            f"ALTER TABLE appointments DROP CONSTRAINT IF EXISTS {constraint},"
+            f" ADD CONSTRAINT {constraint} FOREIGN KEY ({column})"
+            f" REFERENCES {target} (id) ON DELETE {rule}"
+        ))
+
+
+def _idempotency_keys(connection: Connection) -> None:
+    IdempotencyKey.__table__.create(connection, checkfirst=True)
+
+
+def _partitioning(connection: Connection) -> None:
+    # Rebuilds appointments as a table partitioned by month of date_time.
+    # Index and primary key names are schema-wide, so the old table gives
+    # them up before the new one is created.
+    appointments = Appointment.__table__
+    connection.execute(text(
+        "ALTER TABLE appointments RENAME TO appointments_unpartitioned"
+    ))
+    connection.execute(text(
+        "ALTER TABLE appointments_unpartitioned"
+        f" DROP CONSTRAINT IF EXISTS {OVERLAP_CONSTRAINT},"
+        " DROP CONSTRAINT IF EXISTS appointments_pkey"
+    ))
+    for index in appointments.indexes:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    appointments.create(connection)
+    since = connection.execute(
+        text("SELECT min(date_time) FROM appointments_unpartitioned")
+    ).scalar()
+    ensure_partitions(connection, date.today(), since=since and since.date())
+
+    columns = ", ".join(column.name for column in appointments.columns)
+    connection.execute(text(
+        f"INSERT INTO appointments ({columns})"
+        f" SELECT {columns} FROM appointments_unpartitioned"
+    ))
+    connection.execute(text("DROP TABLE appointments_unpartitioned"))
+
+
+def _rollups(connection: Connection) -> None:
+    AppointmentRollup.__table__.create(connection, checkfirst=True)
+    rebuild_on(connection)
+
+
+def _search(connection: Connection) -> None:
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for table, name in (
+        (Master.__table__, "ix_masters_name_trgm"),
+        (Master.__table__, "ix_masters_specialty_trgm"),
+        (Service.__table__, "ix_services_name_trgm"),
+        (Service.__table__, "ix_services_description_trgm"),
+    ):
+        _index(table, name).create(connection, checkfirst=True)
+
+
+# (version, description, upgrade from the previous version). Version 1 is
+# the original create_all schema; steps are idempotent so databases created
+# by any intermediate release upgrade cleanly.
+MIGRATIONS = (
+    (2, "appointment end_time, overlap constraint and list indexes", _scheduling),
+    (3, "archived masters and services, ON DELETE rules", _archiving),
+    (4, "idempotency_keys table", _idempotency_keys),
+    (5, "appointments partitioned by month", _partitioning),
+    (6, "appointment_rollups table", _rollups),
+    (7, "trigram indexes for catalog search", _search),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection: Connection) -> Optional[tuple[int, str]]:
+    statement = (
+        select(schema_version.c.version, schema_version.c.fingerprint)
+        .order_by(schema_version.c.version.desc())
+        .limit(1)
+    )
+    row = connection.execute(statement).first()
+    return tuple(row) if row is not None else None
+
+
+def check_schema(engine: Engine) -> None:
+    # One indexed read; raises SchemaMismatch unless the database is at the
+    # version and fingerprint of the running code.
+    try:
+        with engine.connect() as connection:
+            found = current_version(connection)
+    except DBAPIError:
+        # No schema_version table yet.
+        found = None
+
+    expected = (SCHEMA_VERSION, schema_fingerprint(engine))
+    if found != expected:
+        raise SchemaMismatch(
+            f"Database schema is {found or 'unversioned'}, expected {expected}; "
+            "run `python migrations.py`"
+        )
+
+
+def migrate(engine: Engine) -> int:
+    fingerprint = schema_fingerprint(engine)
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+            )
+
+        found = None
+        if inspect(connection).has_table("schema_version"):
+            found = current_version(connection)
+        if found == (SCHEMA_VERSION, fingerprint):
+            return SCHEMA_VERSION
+
+        if found is not None and found[0] == SCHEMA_VERSION:
+            raise SchemaMismatch(
+                f"Models changed without a migration (fingerprint {found[1]}, "
+                f"code has {fingerprint}); add a step to MIGRATIONS"
+            )
+
+        version_metadata.create_all(connection)
+
+        if found is None and not inspect(connection).has_table("users"):
+            logger.info(f"Creating schema at version {SCHEMA_VERSION}")
+            SQLModel.metadata.create_all(connection)
+            if engine.dialect.name == "postgresql":
+                ensure_partitions(connection, date.today())
+            version = SCHEMA_VERSION
+        else:
+            version = found[0] if found is not None else 1
+            if version < SCHEMA_VERSION and engine.dialect.name != "postgresql":
+                raise SchemaMismatch(
+                    f"Upgrading from version {version} is only supported on "
+                    "PostgreSQL; recreate the database"
+                )
+
+        for step, description, upgrade in MIGRATIONS:
+            if step <= version:
+                continue
+            logger.info(f"Migrating schema to version {step}: {description}")
+            upgrade(connection)
+            version = step
+
+        connection.execute(
+            schema_version.insert().values(version=version, fingerprint=fingerprint)
+        )
+
+    return version
+
+
+def main() -> None:
+    from database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only verify the schema version, exit 1 if it is not current",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        try:
+            check_schema(engine)
+        except SchemaMismatch as exc:
+            print(exc, file=sys.stderr)
+            sys.exit(1)
+        print(f"Schema is at version {SCHEMA_VERSION}")
+        return
+
+    print(f"Schema is at version {migrate(engine)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
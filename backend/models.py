@@ -1,8 +1,25 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import DDL, Index, event, text
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import uuid
 
+CANCELLED_STATUSES = ("canceled", "cancelled")
+OVERLAP_CONSTRAINT = "ex_appointments_master_overlap"
+# Upper bound on a booking's length. Queries for bookings overlapping a
+# window also bound date_time from below by it, so Postgres only scans the
+# partitions around the window.
+MAX_APPOINTMENT_SPAN = timedelta(days=1)
+
+def _trigram_index(name: str, column: str) -> Index:
+    # Serves the lower(column) LIKE '%...%' filters of catalog search.
+    return Index(
+        name,
+        text(f"lower({column}) gin_trgm_ops"),
+        postgresql_using="gin",
+        postgresql_where=text("archived_at IS NULL"),
+    ).ddl_if(dialect="postgresql")
+
 class User(SQLModel, table=True):
     __tablename__ = "users"
 
@@ -12,44 +29,133 @@ class User(SQLModel, table=True):
     name: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-    appointments: list["Appointment"] = Relationship(back_populates="user")
+    # Appointments are removed by ON DELETE CASCADE in the database rather
+    # than loaded and deleted one by one.
+    appointments: list["Appointment"] = Relationship(
+        back_populates="user", passive_deletes=True
+    )
 
 class Master(SQLModel, table=True):
     __tablename__ = "masters"
+    __table_args__ = (
+        Index("ix_masters_specialty_id", "specialty", "id"),
+        # Archived masters keep their appointment history, so uniqueness only
+        # applies to active rows.
+        Index(
+            "uq_masters_phone_active",
+            "phone",
+            unique=True,
+            postgresql_where=text("archived_at IS NULL"),
+            sqlite_where=text("archived_at IS NULL"),
+        ),
+        _trigram_index("ix_masters_name_trgm", "name"),
+        _trigram_index("ix_masters_specialty_trgm", "specialty"),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     name: str
     sex: str
-    phone: str = Field(unique=True, index=True)
+    phone: str
     experience: int = Field(default=0)
     specialty: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    archived_at: Optional[datetime] = None
 
-    appointments: list["Appointment"] = Relationship(back_populates="master")
+    appointments: list["Appointment"] = Relationship(
+        back_populates="master", passive_deletes=True
+    )
 
 class Service(SQLModel, table=True):
     __tablename__ = "services"
+    __table_args__ = (
+        Index(
+            "uq_services_name_active",
+            "name",
+            unique=True,
+            postgresql_where=text("archived_at IS NULL"),
+            sqlite_where=text("archived_at IS NULL"),
+        ),
+        _trigram_index("ix_services_name_trgm", "name"),
+        _trigram_index("ix_services_description_trgm", "description"),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    name: str = Field(unique=True)
+    name: str
     description: str
     price: float
     duration: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    archived_at: Optional[datetime] = None
 
-    appointments: list["Appointment"] = Relationship(back_populates="service")
+    appointments: list["Appointment"] = Relationship(
+        back_populates="service", passive_deletes=True
+    )
 
 class Appointment(SQLModel, table=True):
     __tablename__ = "appointments"
+    __table_args__ = (
+        Index("ix_appointments_date_time_id", "date_time", "id"),
+        Index("ix_appointments_master_id_date_time", "master_id", "date_time"),
+        Index("ix_appointments_user_id_date_time", "user_id", "date_time"),
+        Index("ix_appointments_status_date_time", "status", "date_time"),
+        # Monthly partitions by date_time on Postgres, see partitions.py.
+        # Each partition carries its own overlap exclusion constraint, since
+        # Postgres cannot enforce one across a partitioned table.
+        {"postgresql_partition_by": "RANGE (date_time)"},
+    )
+    # The partition key has to be part of the primary key; the ORM still
+    # identifies appointments by id alone.
+    __mapper_args__ = {"primary_key": ["id"]}
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    date_time: datetime
+    date_time: datetime = Field(primary_key=True)
+    end_time: datetime
     status: str = Field(default="pending")
-    user_id: uuid.UUID = Field(foreign_key="users.id", index=True)
-    master_id: uuid.UUID = Field(foreign_key="masters.id", index=True)
-    service_id: uuid.UUID = Field(foreign_key="services.id", index=True)
+    user_id: uuid.UUID = Field(
+        foreign_key="users.id", ondelete="CASCADE", index=True
+    )
+    master_id: uuid.UUID = Field(
+        foreign_key="masters.id", ondelete="RESTRICT", index=True
+    )
+    service_id: uuid.UUID = Field(
+        foreign_key="services.id", ondelete="RESTRICT", index=True
+    )
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     user: User = Relationship(back_populates="appointments")
     master: Master = Relationship(back_populates="appointments")
     service: Service = Relationship(back_populates="appointments")
+
+class AppointmentRollup(SQLModel, table=True):
+    __tablename__ = "appointment_rollups"
+
+    # Per-day totals maintained by the appointment write paths (rollups.py).
+    # Revenue is not stored: reports multiply by the current Service.price.
+    day: date = Field(primary_key=True)
+    master_id: uuid.UUID = Field(primary_key=True)
+    service_id: uuid.UUID = Field(primary_key=True)
+    appointments: int = Field(default=0)
+    cancelled: int = Field(default=0)
+    booked_minutes: int = Field(default=0)
+
+class IdempotencyKey(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+
+    route: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    request_hash: str
+    # NULL while the first request with this key is still running.
+    status_code: Optional[int] = None
+    body: Optional[bytes] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+for extension in ("btree_gist", "pg_trgm"):
+    event.listen(
+        SQLModel.metadata,
+        "before_create",
+        DDL(f"CREATE EXTENSION IF NOT EXISTS {extension}").execute_if(
+            dialect="postgresql"
+        ),
+    )
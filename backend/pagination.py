@@ -0,0 +1,86 @@
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime
+from typing import Optional
+import base64
+import json
+import os
+import uuid
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(row, keys) -> str:
+    values = []
+    for key in keys:
+        value = getattr(row, key.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else str(value))
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if len(values) != len(keys):
+            raise ValueError("cursor length mismatch")
+        return tuple(
+            _parse(key.type.python_type, value) for key, value in zip(keys, values)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse(python_type, value: str):
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    return python_type(value)
+
+
+async def fetch_page(
+    session: AsyncSession,
+    statement,
+    keys,
+    after: Optional[str],
+    limit: int,
+) -> tuple[list, Optional[str]]:
+    # Keyset pagination: seek past the last row of the previous page on an
+    # index covering `keys` instead of counting rows with OFFSET.
+    if after is not None:
+        decoded = decode_cursor(after, keys)
+        # The row comparison alone does not bound the leading key, which is
+        # what lets Postgres skip partitions before the cursor.
+        statement = statement.where(
+            keys[0] >= decoded[0], tuple_(*keys) > decoded
+        )
+
+    rows = (await session.exec(statement.order_by(*keys).limit(limit + 1))).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], keys)
+
+    return rows, None
+
+
+async def paginate(
+    session: AsyncSession,
+    statement,
+    keys,
+    after: Optional[str],
+    limit: int,
+    response: Response,
+):
+    rows, next_cursor = await fetch_page(session, statement, keys, after, limit)
+
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return rows
@@ -0,0 +1,239 @@
+"""Monthly range partitions of the appointments table (PostgreSQL only).
+
+    python partitions.py  # create upcoming partitions, archive expired ones
+
+Each month of bookings lives in appointments_YYYY_MM with its own overlap
+exclusion constraint; rows outside every monthly range land in
+appointments_default. Partitions that ended more than
+PARTITION_RETENTION_MONTHS ago are detached and moved to the
+PARTITION_ARCHIVE_SCHEMA schema, so they stop weighing on live queries.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import date, datetime, time
+from typing import Iterable, Optional
+from models import CANCELLED_STATUSES, OVERLAP_CONSTRAINT
+import asyncio
+import logging
+import os
+import re
+import uuid
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# 0 keeps every partition attached.
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "24"))
+PARTITION_ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "archive")
+# Seconds between in-process maintenance runs; 0 leaves it to cron.
+PARTITION_MAINTENANCE_INTERVAL = float(
+    os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600")
+)
+
+PARENT = "appointments"
+DEFAULT_PARTITION = "appointments_default"
+MONTHLY_PARTITION = re.compile(r"^appointments_(\d{4})_(\d{2})$")
+MAINTENANCE_LOCK_ID = 4_180_513
+# First key of the per-master pg_advisory_xact_lock(class, key) pairs.
+SCHEDULE_LOCK_CLASS = 4_180_514
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def crosses_month_start(lower: datetime, upper: datetime) -> bool:
+    # Whether a month starts strictly between the two, i.e. rows in that
+    # range can sit in two different partitions.
+    boundary = datetime.combine(month_start(upper.date()), time.min)
+    if boundary == upper:
+        boundary = datetime.combine(add_months(boundary.date(), -1), time.min)
+    return boundary > lower
+
+
+async def lock_schedules(session: AsyncSession, master_ids: Iterable[uuid.UUID]) -> None:
+    # Serializes the writes of these masters until the transaction ends.
+    # Taken in key order so two batches cannot deadlock on each other.
+    keys = {
+        int.from_bytes(master_id.bytes[:4], "big", signed=True)
+        for master_id in master_ids
+    }
+    for key in sorted(keys):
+        await session.execute(
+            text("SELECT pg_advisory_xact_lock(:class_id, :key)"),
+            {"class_id": SCHEDULE_LOCK_CLASS, "key": key},
+        )
+
+
+def overlap_constraint_sql(table: str, name: str) -> str:
+    cancelled = ", ".join(f"'{status}'" for status in CANCELLED_STATUSES)
+    return (
+        f"ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist "
+        "(master_id WITH =, tsrange(date_time, end_time, '[)') WITH &&) "
+        f"WHERE (status NOT IN ({cancelled}))"
+    )
+
+
+def _add_overlap_constraint(connection: Connection, partition: str) -> None:
+    # Exclusion constraints cannot span a partitioned table, so each
+    # partition gets its own. It only sees bookings that start in its own
+    # month; writes near a month start are probed by the application under
+    # lock_schedules instead.
+    suffix = partition[len(PARENT) + 1:]
+    connection.execute(
+        text(overlap_constraint_sql(partition, f"{OVERLAP_CONSTRAINT}_{suffix}"))
+    )
+
+
+def attached_months(connection: Connection) -> list[date]:
+    rows = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT})
+    months = []
+    for (name,) in rows:
+        match = MONTHLY_PARTITION.match(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def _ensure_default(connection: Connection) -> None:
+    exists = connection.execute(
+        text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}
+    ).scalar()
+    if exists is None:
+        connection.execute(text(
+            f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"
+        ))
+        _add_overlap_constraint(connection, DEFAULT_PARTITION)
+
+
+def _create_partition(connection: Connection, month: date) -> None:
+    name = partition_name(month)
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    in_range = "date_time >= :lower AND date_time < :upper"
+
+    # Rows for this month may already sit in the default partition, which
+    # would block ATTACH; move them into the new table first.
+    connection.execute(text(
+        f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)"
+    ))
+    connection.execute(text(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"
+    ), bounds)
+    connection.execute(
+        text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds
+    )
+    connection.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+    ))
+    _add_overlap_constraint(connection, name)
+
+
+def ensure_partitions(
+    connection: Connection,
+    today: date,
+    since: Optional[date] = None,
+) -> list[str]:
+    _ensure_default(connection)
+    existing = set(attached_months(connection))
+    month = month_start(since or today)
+    last = add_months(month_start(today), PARTITION_MONTHS_AHEAD)
+
+    created = []
+    while month <= last:
+        if month not in existing:
+            _create_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partitions(connection: Connection, today: date) -> list[str]:
+    if PARTITION_RETENTION_MONTHS <= 0:
+        return []
+
+    cutoff = add_months(month_start(today), -PARTITION_RETENTION_MONTHS)
+    archived = []
+    for month in attached_months(connection):
+        if add_months(month, 1) > cutoff:
+            break
+        name = partition_name(month)
+        connection.execute(text(
+            f"CREATE SCHEMA IF NOT EXISTS {PARTITION_ARCHIVE_SCHEMA}"
+        ))
+        connection.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        connection.execute(text(
+            f"ALTER TABLE {name} SET SCHEMA {PARTITION_ARCHIVE_SCHEMA}"
+        ))
+        archived.append(name)
+    return archived
+
+
+def maintain(engine: Engine, today: Optional[date] = None) -> tuple[list, list]:
+    if engine.dialect.name != "postgresql":
+        return [], []
+
+    today = today or date.today()
+    with engine.begin() as connection:
+        # One worker maintains at a time; the others skip this round.
+        locked = connection.execute(
+            text("SELECT pg_try_advisory_xact_lock(:id)"),
+            {"id": MAINTENANCE_LOCK_ID},
+        ).scalar()
+        if not locked:
+            return [], []
+        created = ensure_partitions(connection, today)
+        archived = archive_partitions(connection, today)
+
+    if created or archived:
+        logger.info(f"Partitions created: {created}, archived: {archived}")
+    return created, archived
+
+
+class PartitionMaintainer:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(maintain, self.engine)
+            except Exception as exc:
+                logger.warning(f"Partition maintenance failed: {exc}")
+            await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+    def start(self) -> None:
+        if (
+            self.engine.dialect.name == "postgresql"
+            and PARTITION_MAINTENANCE_INTERVAL > 0
+            and self._task is None
+        ):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    created, archived = maintain(engine)
+    print(f"Created {len(created)} partitions, archived {len(archived)}")
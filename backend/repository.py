@@ -0,0 +1,175 @@
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime
+from typing import Any, Generic, Optional, TypeVar
+from cache import Generation, TTLCache
+from models import Appointment, Master, Service, User, OVERLAP_CONSTRAINT
+import os
+
+ModelT = TypeVar("ModelT", bound=SQLModel)
+
+OVERLAP_DETAIL = "Master already has an appointment at this time"
+
+# Per-process cache of rows that rarely change (masters, services), read only
+# by callers that pass use_cache=True. Writes through the repository evict
+# locally; other workers may serve a row up to ROW_CACHE_TTL seconds old.
+# 0 disables it.
+ROW_CACHE_TTL = float(os.getenv("ROW_CACHE_TTL", "30"))
+ROW_CACHE_SIZE = int(os.getenv("ROW_CACHE_SIZE", "10000"))
+
+
+class Repository(Generic[ModelT]):
+    # Single-statement CRUD: every write is one INSERT, UPDATE ... RETURNING
+    # or DELETE ... RETURNING followed by COMMIT, with no SELECT before it
+    # and no refresh after it.
+    def __init__(
+        self,
+        model: type[ModelT],
+        name: str,
+        conflicts: Optional[dict[str, str]] = None,
+        cached: bool = False,
+    ):
+        self.model = model
+        self.name = name
+        # Substring of the violated constraint/column -> 400 detail.
+        self.conflicts = conflicts or {}
+        # Models with `archived_at` are soft-deleted: delete stamps the row
+        # and every other method treats archived rows as missing.
+        self.archivable = "archived_at" in model.model_fields
+        self.cache = TTLCache(ROW_CACHE_SIZE, ROW_CACHE_TTL) if cached else None
+        self._generation = Generation()
+
+    def active(self, statement):
+        if self.archivable:
+            statement = statement.where(self.model.archived_at.is_(None))
+        return statement
+
+    def not_found(self) -> HTTPException:
+        return HTTPException(status_code=404, detail=f"{self.name} not found")
+
+    async def get(
+        self,
+        session: AsyncSession,
+        id: Any,
+        for_update: bool = False,
+        use_cache: bool = False,
+    ) -> ModelT:
+        # use_cache is for reads that tolerate a row ROW_CACHE_TTL seconds
+        # old; anything derived and stored, or cached again, reads the row.
+        use_cache = use_cache and self.cache is not None and not for_update
+        if use_cache:
+            values = self.cache.get(id)
+            if values is not None:
+                # A fresh transient instance per caller; nothing is shared.
+                return self.model(**values)
+
+        generation = self._generation.value
+        # Primary-key load: answered from the session's identity map when
+        # the row is already there. The lock is held until the write that
+        # follows commits (ignored by SQLite).
+        obj = await session.get(
+            self.model, id, with_for_update=for_update, populate_existing=for_update
+        )
+
+        if obj is None or (self.archivable and obj.archived_at is not None):
+            raise self.not_found()
+
+        if use_cache and self._generation.unchanged_since(generation):
+            self.cache.set(id, obj.model_dump())
+        return obj
+
+    def evict(self, id: Any) -> None:
+        if self.cache is not None:
+            self._generation.advance()
+            self.cache.pop(id)
+
+    async def create(self, session: AsyncSession, obj: ModelT) -> ModelT:
+        session.add(obj)
+        await self._commit(session)
+        return obj
+
+    async def update(
+        self,
+        session: AsyncSession,
+        id: Any,
+        values: dict[str, Any],
+    ) -> ModelT:
+        if not values:
+            return await self.get(session, id)
+
+        statement = self.active(
+            update(self.model).where(self.model.id == id).values(**values)
+        )
+        obj = await self._write(session, statement.returning(self.model))
+        self.evict(id)
+
+        if obj is None:
+            raise self.not_found()
+
+        return obj
+
+    async def delete(self, session: AsyncSession, id: Any) -> ModelT:
+        if self.archivable:
+            statement = self.active(
+                update(self.model)
+                .where(self.model.id == id)
+                .values(archived_at=datetime.utcnow())
+            )
+        else:
+            statement = delete(self.model).where(self.model.id == id)
+
+        obj = await self._write(session, statement.returning(self.model))
+        self.evict(id)
+
+        if obj is None:
+            raise self.not_found()
+
+        return obj
+
+    async def _write(self, session: AsyncSession, statement) -> Optional[ModelT]:
+        try:
+            obj = (await session.execute(statement)).scalar_one_or_none()
+        except IntegrityError as exc:
+            await session.rollback()
+            raise self._integrity_error(exc)
+
+        if obj is None:
+            await session.rollback()
+            return None
+
+        await self._commit(session)
+        return obj
+
+    async def _commit(self, session: AsyncSession) -> None:
+        try:
+            await session.commit()
+        except IntegrityError as exc:
+            await session.rollback()
+            raise self._integrity_error(exc)
+
+    def _integrity_error(self, exc: IntegrityError) -> HTTPException:
+        message = str(exc.orig)
+        for marker, detail in self.conflicts.items():
+            if marker in message:
+                return HTTPException(status_code=400, detail=detail)
+        return HTTPException(
+            status_code=409,
+            detail=f"{self.name} conflicts with existing records",
+        )
+
+
+user_repository = Repository(
+    User, "User", {"email": "Email already registered"}
+)
+master_repository = Repository(
+    Master, "Master", {"phone": "Phone already registered"}, cached=True
+)
+service_repository = Repository(
+    Service, "Service", {"name": "Service already exists"}, cached=True
+)
+appointment_repository = Repository(
+    Appointment, "Appointment", {OVERLAP_CONSTRAINT: OVERLAP_DETAIL}
+)
@@ -0,0 +1,195 @@
+"""Daily appointment totals per master and service.
+
+    python rollups.py                      # rebuild every rollup row
+    python rollups.py --since 2026-01-01   # rebuild from that day on
+
+Every appointment write adds its delta to appointment_rollups in the same
+transaction, so reports read days x masters x services rows instead of
+scanning appointments. The rebuild recomputes the table from appointments,
+e.g. after writes made outside the API. Use --since to keep the totals of
+months whose partitions were archived.
+"""
+from sqlalchemy import Date, case, delete, func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Mapping, Optional
+from models import Appointment, AppointmentRollup, User, CANCELLED_STATUSES
+import argparse
+import logging
+import os
+import uuid
+
+REBUILD_BATCH_SIZE = int(os.getenv("ROLLUP_REBUILD_BATCH_SIZE", "10000"))
+
+COUNTERS = ("appointments", "cancelled", "booked_minutes")
+# Appointment columns a rollup row is derived from.
+SOURCE_COLUMNS = (
+    Appointment.date_time,
+    Appointment.end_time,
+    Appointment.status,
+    Appointment.master_id,
+    Appointment.service_id,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RollupDelta:
+    # Net change of each (day, master, service) row caused by one write;
+    # moving a booking removes it from one row and adds it to another.
+    def __init__(self):
+        self._changes = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, appointment: Mapping, sign: int = 1) -> None:
+        key = (
+            appointment["date_time"].date(),
+            appointment["master_id"],
+            appointment["service_id"],
+        )
+        change = self._changes[key]
+        if appointment["status"] in CANCELLED_STATUSES:
+            change[1] += sign
+        else:
+            length = appointment["end_time"] - appointment["date_time"]
+            change[0] += sign
+            change[2] += sign * int(length.total_seconds() // 60)
+
+    def remove(self, appointment: Mapping) -> None:
+        self.add(appointment, -1)
+
+    def rows(self) -> list[dict]:
+        return [
+            {
+                "day": day,
+                "master_id": master_id,
+                "service_id": service_id,
+                **dict(zip(COUNTERS, change)),
+            }
+            for (day, master_id, service_id), change in self._changes.items()
+            if any(change)
+        ]
+
+    async def apply(self, session: AsyncSession) -> None:
+        rows = self.rows()
+        if rows:
+            await session.execute(_upsert(session.bind.dialect.name), rows)
+
+
+def _upsert(dialect: str):
+    statement = (postgresql if dialect == "postgresql" else sqlite).insert(
+        AppointmentRollup
+    )
+    return statement.on_conflict_do_update(
+        index_elements=["day", "master_id", "service_id"],
+        set_={
+            name: getattr(AppointmentRollup, name) + getattr(statement.excluded, name)
+            for name in COUNTERS
+        },
+    )
+
+
+def _minutes(dialect: str):
+    # Whole minutes of each booking, floored as in RollupDelta.add.
+    if dialect == "postgresql":
+        return func.floor(
+            func.extract("epoch", Appointment.end_time - Appointment.date_time) / 60
+        )
+    return (
+        func.strftime("%s", Appointment.end_time)
+        - func.strftime("%s", Appointment.date_time)
+    ) / 60
+
+
+async def remove_user_appointments(
+    session: AsyncSession, user_id
+) -> set[tuple[uuid.UUID, date]]:
+    # Called before a user delete, whose appointments go with ON DELETE
+    # CASCADE. Their totals are subtracted per rollup row by one grouped
+    # query, without loading the bookings; returns the (master, day) slots
+    # they were in.
+    dialect = session.bind.dialect.name
+    # Holds off new bookings for the user until the delete commits.
+    await session.execute(
+        select(User.id).where(User.id == user_id).with_for_update()
+    )
+
+    day = func.date(Appointment.date_time, type_=Date)
+    is_cancelled = Appointment.status.in_(CANCELLED_STATUSES)
+    statement = (
+        select(
+            day,
+            Appointment.master_id,
+            Appointment.service_id,
+            func.sum(case((is_cancelled, 0), else_=1)),
+            func.sum(case((is_cancelled, 1), else_=0)),
+            func.sum(case((is_cancelled, 0), else_=_minutes(dialect))),
+        )
+        .where(Appointment.user_id == user_id)
+        .group_by(day, Appointment.master_id, Appointment.service_id)
+    )
+    rows = [
+        {
+            "day": row[0],
+            "master_id": row[1],
+            "service_id": row[2],
+            **{name: -int(value) for name, value in zip(COUNTERS, row[3:])},
+        }
+        for row in (await session.execute(statement)).all()
+    ]
+    if rows:
+        await session.execute(_upsert(dialect), rows)
+    return {(row["master_id"], row["day"]) for row in rows}
+
+
+def rebuild_on(connection: Connection, since: Optional[date] = None) -> int:
+    if connection.dialect.name == "postgresql":
+        # Concurrent writers wait for the rebuild, then add their deltas
+        # on top of it.
+        connection.execute(text("LOCK TABLE appointment_rollups IN EXCLUSIVE MODE"))
+
+    cleared = delete(AppointmentRollup)
+    source = select(*SOURCE_COLUMNS)
+    if since is not None:
+        cleared = cleared.where(AppointmentRollup.day >= since)
+        source = source.where(
+            Appointment.date_time >= datetime.combine(since, datetime.min.time())
+        )
+    connection.execute(cleared)
+
+    delta = RollupDelta()
+    result = connection.execution_options(yield_per=REBUILD_BATCH_SIZE).execute(source)
+    for row in result:
+        delta.add(row._mapping)
+
+    rows = delta.rows()
+    if rows:
+        connection.execute(insert(AppointmentRollup), rows)
+    return len(rows)
+
+
+def rebuild(engine: Engine, since: Optional[date] = None) -> int:
+    with engine.begin() as connection:
+        count = rebuild_on(connection, since)
+    logger.info(f"Rebuilt {count} appointment rollup rows")
+    return count
+
+
+def main() -> None:
+    from database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--since",
+        type=date.fromisoformat,
+        help="only rebuild days from this date (YYYY-MM-DD) on",
+    )
+    args = parser.parse_args()
+    print(f"Rebuilt {rebuild(engine, args.since)} rollup rows")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,3 +1,3 @@
-from . import users, masters, services, appointments
+from . import users, masters, services, appointments, reports
 
-__all__ = ["users", "masters", "services", "appointments"]
+__all__ = ["users", "masters", "services", "appointments", "reports"]
@@ -1,101 +1,597 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from models import Appointment
-from schemas import AppointmentCreate, AppointmentRead, AppointmentUpdate
-from database import get_session
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlmodel import select
+from sqlalchemy.orm import selectinload
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from models import (
+    Appointment,
+    Service,
+    CANCELLED_STATUSES,
+    MAX_APPOINTMENT_SPAN,
+    OVERLAP_CONSTRAINT,
+)
+from schemas import (
+    AppointmentCreate,
+    AppointmentRead,
+    AppointmentExpanded,
+    AppointmentUpdate,
+    AppointmentBulkRead,
+    AppointmentBulkResult,
+)
+from database import get_async_session, get_read_session, replicas
+from availability import occupancy
+from events import appointment_feed
+from rollups import RollupDelta
+from partitions import crosses_month_start, lock_schedules
+from pagination import fetch_page, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from serialization import (
+    LEAN_RESPONSES,
+    dump_rows,
+    json_response,
+    parse_fields,
+    select_columns,
+)
+from repository import (
+    appointment_repository,
+    master_repository,
+    service_repository,
+    user_repository,
+    OVERLAP_DETAIL,
+)
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import bisect
+import os
+from typing import AsyncIterator, Literal, Optional
+import csv
+import io
 import logging
+import orjson
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+SCHEDULE_FIELDS = {"date_time", "service_id", "master_id", "status"}
+
+BULK_MAX_ITEMS = int(os.getenv("APPOINTMENTS_BULK_MAX_ITEMS", "10000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("APPOINTMENTS_EXPORT_CHUNK_SIZE", "1000"))
+
+EXPORT_COLUMNS = (
+    "id",
+    "date_time",
+    "end_time",
+    "status",
+    "user_id",
+    "master_id",
+    "service_id",
+    "created_at",
+)
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+EXPANDABLE = {
+    "user": Appointment.user,
+    "master": Appointment.master,
+    "service": Appointment.service,
+}
+
+
+async def _find_overlap(
+    session: AsyncSession,
+    master_id: uuid.UUID,
+    start: datetime,
+    end: datetime,
+    exclude_id: Optional[uuid.UUID] = None,
+) -> Optional[uuid.UUID]:
+    statement = select(Appointment.id).where(
+        Appointment.master_id == master_id,
+        # The lower bound on date_time is implied by end_time > start, but
+        # only a date_time range lets Postgres prune partitions.
+        Appointment.date_time > start - MAX_APPOINTMENT_SPAN,
+        Appointment.date_time < end,
+        Appointment.end_time > start,
+        Appointment.status.not_in(CANCELLED_STATUSES),
+    )
+    if exclude_id is not None:
+        statement = statement.where(Appointment.id != exclude_id)
+    return (await session.exec(statement.limit(1))).first()
+
+
+def _near_month_start(start: datetime, end: datetime) -> bool:
+    # Overlapping bookings may sit in two monthly partitions, whose
+    # exclusion constraints cannot see each other.
+    return crosses_month_start(start - MAX_APPOINTMENT_SPAN, end)
+
+
+async def _probes_overlap(
+    session: AsyncSession, master_id: uuid.UUID, start: datetime, end: datetime
+) -> bool:
+    # Postgres rejects overlaps through the partition's exclusion constraint
+    # in the same round trip as the write, except across a month start:
+    # there the probe runs too, under a per-master lock so two such writes
+    # cannot both pass it. Other backends always need the indexed probe.
+    if session.bind.dialect.name != "postgresql":
+        return True
+    if not _near_month_start(start, end):
+        return False
+    await lock_schedules(session, [master_id])
+    return True
+
+
+async def _check_overlap(
+    session: AsyncSession,
+    master_id: uuid.UUID,
+    status: str,
+    start: datetime,
+    end: datetime,
+    exclude_id: Optional[uuid.UUID] = None,
+) -> None:
+    if (
+        status not in CANCELLED_STATUSES
+        and await _probes_overlap(session, master_id, start, end)
+        and await _find_overlap(session, master_id, start, end, exclude_id)
+    ):
+        raise HTTPException(status_code=400, detail=OVERLAP_DETAIL)
+
+
+async def _check_references(session: AsyncSession, values: dict) -> None:
+    # As in the bulk import: an unknown user, or a master that is unknown or
+    # archived, is a 404 instead of the foreign key's generic 409.
+    for field, repository in (
+        ("user_id", user_repository),
+        ("master_id", master_repository),
+    ):
+        if values.get(field) is not None:
+            await repository.get(session, values[field])
+
+
+def _track_occupancy(appointment: Appointment) -> None:
+    if appointment.status in CANCELLED_STATUSES:
+        occupancy.discard(appointment.id)
+        return
+
+    occupancy.add(
+        appointment.id,
+        appointment.master_id,
+        appointment.date_time,
+        appointment.end_time,
+    )
+
 
 @router.post("/", response_model=AppointmentRead, status_code=201)
-def create_appointment(
+async def create_appointment(
     appointment: AppointmentCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    statement = select(Appointment).where(
-        Appointment.master_id == appointment.master_id,
-        Appointment.date_time == appointment.date_time
-    )
-    existing_appointment = session.exec(statement).first()
-
-    if existing_appointment:
-        raise HTTPException(
-            status_code=400,
-            detail="Master already has an appointment at this time"
-        )
+    service = await service_repository.get(session, appointment.service_id)
+    await _check_references(session, appointment.model_dump())
 
     new_appointment = Appointment(
         date_time=appointment.date_time,
+        end_time=appointment.date_time + timedelta(minutes=service.duration),
         user_id=appointment.user_id,
         master_id=appointment.master_id,
         service_id=appointment.service_id,
         status="pending"
     )
 
-    session.add(new_appointment)
-    session.commit()
-    session.refresh(new_appointment)
+    await _check_overlap(
+        session,
+        new_appointment.master_id,
+        new_appointment.status,
+        new_appointment.date_time,
+        new_appointment.end_time,
+    )
+    rollup = RollupDelta()
+    rollup.add(new_appointment.model_dump())
+    await rollup.apply(session)
+    await appointment_repository.create(session, new_appointment)
+    _track_occupancy(new_appointment)
+    await appointment_feed.publish("created", new_appointment)
 
     logger.info(f"Appointment created: {new_appointment.id}")
     return new_appointment
 
 
-@router.get("/", response_model=list[AppointmentRead])
-def get_appointments(session: Session = Depends(get_session)):
-    statement = select(Appointment)
-    appointments = session.exec(statement).all()
-    return appointments
+class _MasterSchedule:
+    # Disjoint busy intervals of one master, sorted by start, so a
+    # candidate booking is checked against its predecessor with bisect.
+    def __init__(self, intervals: list[tuple[datetime, datetime]]):
+        self.starts: list[datetime] = []
+        self.ends: list[datetime] = []
+        for start, end in sorted(intervals):
+            if self.ends and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def try_book(self, start: datetime, end: datetime) -> bool:
+        position = bisect.bisect_left(self.starts, end)
+        if position > 0 and self.ends[position - 1] > start:
+            return False
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        return True
+
+
+async def _existing_ids(session: AsyncSession, repository, ids: set) -> set:
+    model = repository.model
+    statement = repository.active(select(model.id).where(model.id.in_(ids)))
+    return set((await session.exec(statement)).all())
+
+
+@router.post("/bulk", response_model=AppointmentBulkRead)
+async def create_appointments_bulk(
+    appointments: list[AppointmentCreate],
+    session: AsyncSession = Depends(get_async_session)
+):
+    if len(appointments) > BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BULK_MAX_ITEMS} appointments per request"
+        )
+
+    statement = service_repository.active(
+        select(Service.id, Service.duration).where(
+            Service.id.in_({item.service_id for item in appointments})
+        )
+    )
+    durations = dict((await session.exec(statement)).all())
+    users = await _existing_ids(
+        session, user_repository, {a.user_id for a in appointments}
+    )
+    masters = await _existing_ids(
+        session, master_repository, {a.master_id for a in appointments}
+    )
+
+    results: list[AppointmentBulkResult] = []
+    candidates = []
+    for index, item in enumerate(appointments):
+        if item.service_id not in durations:
+            detail = "Service not found"
+        elif item.user_id not in users:
+            detail = "User not found"
+        elif item.master_id not in masters:
+            detail = "Master not found"
+        else:
+            end_time = item.date_time + timedelta(minutes=durations[item.service_id])
+            candidates.append((index, item, end_time))
+            results.append(AppointmentBulkResult(index=index, status="created"))
+            continue
+        results.append(
+            AppointmentBulkResult(index=index, status="invalid", detail=detail)
+        )
+
+    schedules: dict[uuid.UUID, _MasterSchedule] = {}
+    if candidates and session.bind.dialect.name == "postgresql":
+        # Same month-start rule as single writes: those masters are locked
+        # before the read so the in-memory check stays valid until commit.
+        await lock_schedules(session, {
+            item.master_id for _, item, end_time in candidates
+            if _near_month_start(item.date_time, end_time)
+        })
+    if candidates:
+        # One set-based read of every active booking that could collide with
+        # the batch; the rest of the conflict check happens in memory.
+        earliest = min(item.date_time for _, item, _ in candidates)
+        statement = select(
+            Appointment.master_id, Appointment.date_time, Appointment.end_time
+        ).where(
+            Appointment.master_id.in_({item.master_id for _, item, _ in candidates}),
+            Appointment.date_time > earliest - MAX_APPOINTMENT_SPAN,
+            Appointment.date_time < max(end for _, _, end in candidates),
+            Appointment.end_time > earliest,
+            Appointment.status.not_in(CANCELLED_STATUSES),
+        )
+        busy = defaultdict(list)
+        for master_id, start, end in (await session.exec(statement)).all():
+            busy[master_id].append((start, end))
+        schedules = {
+            master_id: _MasterSchedule(busy[master_id])
+            for master_id in {item.master_id for _, item, _ in candidates}
+        }
+
+    now = datetime.utcnow()
+    rows = []
+    for index, item, end_time in candidates:
+        if not schedules[item.master_id].try_book(item.date_time, end_time):
+            results[index] = AppointmentBulkResult(
+                index=index, status="conflict", detail=OVERLAP_DETAIL
+            )
+            continue
+        appointment_id = uuid.uuid4()
+        results[index].id = appointment_id
+        rows.append({
+            "id": appointment_id,
+            "date_time": item.date_time,
+            "end_time": end_time,
+            "status": "pending",
+            "user_id": item.user_id,
+            "master_id": item.master_id,
+            "service_id": item.service_id,
+            "created_at": now,
+        })
+
+    if rows:
+        rollup = RollupDelta()
+        for row in rows:
+            rollup.add(row)
+        try:
+            await session.execute(insert(Appointment), rows)
+            await rollup.apply(session)
+            await session.commit()
+        except IntegrityError as exc:
+            await session.rollback()
+            if OVERLAP_CONSTRAINT in str(exc.orig):
+                # A concurrent booking landed between the read and the insert.
+                raise HTTPException(
+                    status_code=409,
+                    detail="Schedule changed during import, retry the batch"
+                )
+            raise
+
+    for row in rows:
+        occupancy.add(row["id"], row["master_id"], row["date_time"], row["end_time"])
+    await appointment_feed.publish_many(("created", row) for row in rows)
+
+    logger.info(f"Appointments imported: {len(rows)} of {len(appointments)}")
+    return AppointmentBulkRead(
+        created=len(rows),
+        rejected=len(appointments) - len(rows),
+        results=results,
+    )
+
+
+def _parse_expand(expand: Optional[str]) -> list[str]:
+    if not expand:
+        return []
+
+    names = [name.strip() for name in expand.split(",") if name.strip()]
+    unknown = sorted(set(names) - EXPANDABLE.keys())
+
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot expand: {', '.join(unknown)}"
+        )
 
+    return names
 
-@router.get("/{appointment_id}", response_model=AppointmentRead)
-def get_appointment(appointment_id: str, session: Session = Depends(get_session)):
-    statement = select(Appointment).where(Appointment.id == appointment_id)
-    appointment = session.exec(statement).first()
+
+def _expand_options(names: list[str]) -> list:
+    # One extra IN query per relationship, however many rows are on the page.
+    return [selectinload(EXPANDABLE[name]) for name in names]
+
+
+def _with_expand(statement, names: list[str]):
+    return statement.options(*_expand_options(names))
+
+
+def _expanded(appointment: Appointment, names: list[str]) -> AppointmentExpanded:
+    # Only eagerly loaded relationships are touched; anything else would
+    # lazy-load, which the async session does not allow.
+    data = AppointmentRead.model_validate(appointment).model_dump()
+    for name in names:
+        data[name] = getattr(appointment, name)
+    return AppointmentExpanded.model_validate(data)
+
+
+@router.get(
+    "/",
+    response_model=list[AppointmentExpanded],
+    response_model_exclude_unset=True,
+)
+async def get_appointments(
+    response: Response,
+    master_id: Optional[uuid.UUID] = None,
+    user_id: Optional[uuid.UUID] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_session)
+):
+    names = _parse_expand(expand)
+    keys = (Appointment.date_time, Appointment.id)
+    filters = []
+
+    if master_id is not None:
+        filters.append(Appointment.master_id == master_id)
+    if user_id is not None:
+        filters.append(Appointment.user_id == user_id)
+    if status is not None:
+        filters.append(Appointment.status == status)
+    if date_from is not None:
+        filters.append(Appointment.date_time >= date_from)
+    if date_to is not None:
+        filters.append(Appointment.date_time < date_to)
+
+    if names and fields:
+        raise HTTPException(
+            status_code=400,
+            detail="fields cannot be combined with expand"
+        )
+
+    if not names and (LEAN_RESPONSES or fields):
+        columns = parse_fields(fields, AppointmentRead)
+        statement = select(*select_columns(Appointment, columns, keys))
+        rows, next_cursor = await fetch_page(
+            session, statement.where(*filters), keys, after, limit
+        )
+        return json_response(dump_rows(rows, columns), next_cursor)
+
+    statement = _with_expand(select(Appointment), names).where(*filters)
+    appointments = await paginate(session, statement, keys, after, limit, response)
+    return [_expanded(appointment, names) for appointment in appointments]
+
+
+def _export_value(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _encode_chunk(rows, export_format: str) -> bytes:
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [_export_value(value) for value in row] for row in rows
+        )
+        return buffer.getvalue().encode()
+
+    return b"".join(
+        orjson.dumps(dict(zip(EXPORT_COLUMNS, map(_export_value, row)))) + b"\n"
+        for row in rows
+    )
+
+
+async def _stream_export(statement, export_format: str) -> AsyncIterator[bytes]:
+    # Request-scoped sessions are closed before a streaming body is sent, so
+    # the export owns its session for as long as the cursor is open.
+    async with AsyncSession(replicas.engine()) as session:
+        if export_format == "csv":
+            yield (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+
+        result = await session.stream(
+            statement.execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        async for rows in result.partitions():
+            yield _encode_chunk(rows, export_format)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_appointments(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    master_id: Optional[uuid.UUID] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    statement = select(
+        *(getattr(Appointment, column) for column in EXPORT_COLUMNS)
+    ).order_by(Appointment.date_time, Appointment.id)
+
+    if master_id is not None:
+        statement = statement.where(Appointment.master_id == master_id)
+    if date_from is not None:
+        statement = statement.where(Appointment.date_time >= date_from)
+    if date_to is not None:
+        statement = statement.where(Appointment.date_time < date_to)
+
+    return StreamingResponse(
+        _stream_export(statement, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename=appointments.{export_format}"
+        },
+    )
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def appointment_events(
+    master_id: Optional[uuid.UUID] = None,
+    day: Optional[date] = Query(None, alias="date"),
+):
+    # Server-Sent Events: created/updated/deleted deltas for the matching
+    # bookings, or `reset` when the client has to reload the list.
+    subscriber = appointment_feed.subscribe(master_id, day)
+    return StreamingResponse(
+        appointment_feed.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/{appointment_id}",
+    response_model=AppointmentExpanded,
+    response_model_exclude_unset=True,
+)
+async def get_appointment(
+    appointment_id: uuid.UUID,
+    expand: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    names = _parse_expand(expand)
+    appointment = await session.get(
+        Appointment, appointment_id, options=_expand_options(names)
+    )
 
     if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
+        raise appointment_repository.not_found()
 
-    return appointment
+    return _expanded(appointment, names)
 
 
 @router.put("/{appointment_id}", response_model=AppointmentRead)
-def update_appointment(
-    appointment_id: str,
+async def update_appointment(
+    appointment_id: uuid.UUID,
     appointment_update: AppointmentUpdate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    statement = select(Appointment).where(Appointment.id == appointment_id)
-    appointment = session.exec(statement).first()
+    update_data = appointment_update.model_dump(exclude_unset=True)
+    await _check_references(session, update_data)
+    rescheduled = "date_time" in update_data or "service_id" in update_data
+    previous = None
 
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
+    # The current row is needed to derive end_time, to move the booking
+    # between rollup rows, to tell feed subscribers where it came from and
+    # to run the overlap probe; other edits are a single UPDATE ... RETURNING.
+    if not SCHEDULE_FIELDS.isdisjoint(update_data):
+        current = await appointment_repository.get(
+            session, appointment_id, for_update=True
+        )
+        previous = (current.master_id, current.date_time)
+        values = {**current.model_dump(), **update_data}
 
-    update_data = appointment_update.model_dump(exclude_unset=True)
+        if rescheduled:
+            service = await service_repository.get(session, values["service_id"])
+            values["end_time"] = update_data["end_time"] = (
+                values["date_time"] + timedelta(minutes=service.duration)
+            )
 
-    for key, value in update_data.items():
-        setattr(appointment, key, value)
+        await _check_overlap(
+            session,
+            values["master_id"],
+            values["status"],
+            values["date_time"],
+            values["end_time"],
+            exclude_id=current.id,
+        )
 
-    session.add(appointment)
-    session.commit()
-    session.refresh(appointment)
+        rollup = RollupDelta()
+        rollup.remove(current.model_dump())
+        rollup.add(values)
+        await rollup.apply(session)
+
+    appointment = await appointment_repository.update(
+        session, appointment_id, update_data
+    )
+    _track_occupancy(appointment)
+    await appointment_feed.publish("updated", appointment, previous)
 
     logger.info(f"Appointment updated: {appointment.id}")
     return appointment
 
 
 @router.delete("/{appointment_id}")
-def delete_appointment(appointment_id: str, session: Session = Depends(get_session)):
-    statement = select(Appointment).where(Appointment.id == appointment_id)
-    appointment = session.exec(statement).first()
-
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
+async def delete_appointment(
+    appointment_id: uuid.UUID,
+    session: AsyncSession = Depends(get_async_session)
+):
+    current = await appointment_repository.get(
+        session, appointment_id, for_update=True
+    )
+    rollup = RollupDelta()
+    rollup.remove(current.model_dump())
+    await rollup.apply(session)
 
-    session.delete(appointment)
-    session.commit()
+    appointment = await appointment_repository.delete(session, appointment_id)
+    occupancy.discard(appointment.id)
+    await appointment_feed.publish("deleted", appointment)
 
     logger.info(f"Appointment deleted: {appointment.id}")
     return {"message": "Appointment deleted successfully"}
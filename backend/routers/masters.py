@@ -1,22 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Query, Request
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models import Master
-from schemas import MasterCreate, MasterRead, MasterUpdate
-from database import get_session
+from schemas import MasterCreate, MasterRead, MasterUpdate, AvailabilityRead
+from database import get_async_session, get_read_session
+from availability import get_busy_intervals, free_slots
+from pagination import fetch_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from catalog import master_catalog, master_records, catalog_response
+from search import SEARCH_MAX_RESULTS, master_search
+from repository import master_repository, service_repository
+from datetime import date, datetime, time, timedelta
+from typing import Optional
 import logging
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
 @router.post("/", response_model=MasterRead, status_code=201)
-def create_master(master: MasterCreate, session: Session = Depends(get_session)):
-    statement = select(Master).where(Master.phone == master.phone)
-    existing_master = session.exec(statement).first()
-
-    if existing_master:
-        raise HTTPException(status_code=400, detail="Phone already registered")
-
+async def create_master(
+    master: MasterCreate,
+    session: AsyncSession = Depends(get_async_session)
+):
     new_master = Master(
         name=master.name,
         sex=master.sex,
@@ -25,67 +31,107 @@ def create_master(master: MasterCreate, session: Session = Depends(get_session))
         specialty=master.specialty
     )
 
-    session.add(new_master)
-    session.commit()
-    session.refresh(new_master)
+    await master_repository.create(session, new_master)
+    master_catalog.invalidate()
+    master_search.invalidate()
 
     logger.info(f"Master created: {new_master.name}")
     return new_master
 
 
 @router.get("/", response_model=list[MasterRead])
-def get_masters(session: Session = Depends(get_session)):
-    statement = select(Master)
-    masters = session.exec(statement).all()
-    return masters
+async def get_masters(
+    request: Request,
+    specialty: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_async_session)
+):
+    statement = master_repository.active(select(Master))
 
+    if specialty is not None:
+        statement = statement.where(Master.specialty == specialty)
 
-@router.get("/{master_id}", response_model=MasterRead)
-def get_master(master_id: str, session: Session = Depends(get_session)):
-    statement = select(Master).where(Master.id == master_id)
-    master = session.exec(statement).first()
+    # Pages stay cached until the next write, so they are loaded from the
+    # primary: a lagging replica could pin a stale page after invalidation.
+    page = await master_catalog.get_or_load(
+        (specialty, after, limit),
+        lambda: fetch_page(session, statement, (Master.id,), after, limit),
+    )
+    return catalog_response(request, page)
 
-    if not master:
-        raise HTTPException(status_code=404, detail="Master not found")
 
-    return master
+@router.get("/search", response_model=list[MasterRead])
+async def search_masters(
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_RESULTS),
+    session: AsyncSession = Depends(get_read_session)
+):
+    # Case-insensitive match on name and specialty, best matches first.
+    return await master_search.search(session, q, limit, offset)
 
 
-@router.put("/{master_id}", response_model=MasterRead)
-def update_master(
-    master_id: str,
-    master_update: MasterUpdate,
-    session: Session = Depends(get_session)
+@router.get("/{master_id}", response_model=MasterRead)
+async def get_master(request: Request, master_id: uuid.UUID):
+    # A spike on one master costs one query per RECORD_CACHE_TTL per worker.
+    page = await master_records.get(master_id)
+    return catalog_response(request, page)
+
+
+@router.get("/{master_id}/availability", response_model=AvailabilityRead)
+async def get_master_availability(
+    master_id: uuid.UUID,
+    service_id: uuid.UUID,
+    day: date = Query(alias="date"),
+    session: AsyncSession = Depends(get_async_session)
 ):
-    statement = select(Master).where(Master.id == master_id)
-    master = session.exec(statement).first()
+    # Only displayed, so rows up to ROW_CACHE_TTL old will do.
+    master = await master_repository.get(session, master_id, use_cache=True)
+    service = await service_repository.get(session, service_id, use_cache=True)
+
+    # Loaded days are kept in the occupancy index, so they are read from the
+    # primary for the same reason as the catalog.
+    intervals = await get_busy_intervals(session, master.id, day)
+    day_start = datetime.combine(day, time.min)
+
+    return AvailabilityRead(
+        master_id=master.id,
+        service_id=service.id,
+        date=day,
+        duration=service.duration,
+        slots=[
+            day_start + timedelta(minutes=minute)
+            for minute in free_slots(intervals, service.duration)
+        ],
+    )
 
-    if not master:
-        raise HTTPException(status_code=404, detail="Master not found")
 
+@router.put("/{master_id}", response_model=MasterRead)
+async def update_master(
+    master_id: uuid.UUID,
+    master_update: MasterUpdate,
+    session: AsyncSession = Depends(get_async_session)
+):
     update_data = master_update.model_dump(exclude_unset=True)
-
-    for key, value in update_data.items():
-        setattr(master, key, value)
-
-    session.add(master)
-    session.commit()
-    session.refresh(master)
+    master = await master_repository.update(session, master_id, update_data)
+    master_catalog.invalidate()
+    master_records.invalidate(master_id)
+    master_search.invalidate()
 
     logger.info(f"Master updated: {master.name}")
     return master
 
 
 @router.delete("/{master_id}")
-def delete_master(master_id: str, session: Session = Depends(get_session)):
-    statement = select(Master).where(Master.id == master_id)
-    master = session.exec(statement).first()
-
-    if not master:
-        raise HTTPException(status_code=404, detail="Master not found")
-
-    session.delete(master)
-    session.commit()
+async def delete_master(
+    master_id: uuid.UUID,
+    session: AsyncSession = Depends(get_async_session)
+):
+    master = await master_repository.delete(session, master_id)
+    master_catalog.invalidate()
+    master_records.invalidate(master_id)
+    master_search.invalidate()
 
     logger.info(f"Master deleted: {master.name}")
     return {"message": "Master deleted successfully"}
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import AppointmentRollup, Service
+from schemas import RevenueReportRow
+from database import get_read_session
+from availability import OPENING_HOUR, CLOSING_HOUR
+from datetime import date
+import os
+
+router = APIRouter()
+
+MAX_REPORT_DAYS = int(os.getenv("REPORTS_MAX_DAYS", "1096"))
+OPEN_MINUTES = (CLOSING_HOUR - OPENING_HOUR) * 60
+
+GROUPINGS = {
+    "day": AppointmentRollup.day,
+    "master": AppointmentRollup.master_id,
+    "service": AppointmentRollup.service_id,
+}
+
+
+def _parse_group_by(group_by: str) -> list[str]:
+    names = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = sorted(set(names) - GROUPINGS.keys())
+
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"group_by takes a comma-separated subset of: {', '.join(GROUPINGS)}"
+        )
+
+    return list(dict.fromkeys(names))
+
+
+@router.get("/revenue", response_model=list[RevenueReportRow])
+async def get_revenue_report(
+    date_from: date,
+    date_to: date,
+    group_by: str = "day",
+    session: AsyncSession = Depends(get_read_session)
+):
+    names = _parse_group_by(group_by)
+    days = (date_to - date_from).days
+
+    if not 0 < days <= MAX_REPORT_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"date_to must be 1-{MAX_REPORT_DAYS} days after date_from"
+        )
+
+    # Reads the rollup rows of the range, never the appointments; revenue
+    # uses the current price of each service.
+    columns = [GROUPINGS[name] for name in names]
+    statement = (
+        select(
+            *columns,
+            func.sum(AppointmentRollup.appointments).label("appointments"),
+            func.sum(AppointmentRollup.cancelled).label("cancelled"),
+            func.sum(AppointmentRollup.booked_minutes).label("booked_minutes"),
+            func.sum(AppointmentRollup.appointments * Service.price).label("revenue"),
+        )
+        .join(Service, Service.id == AppointmentRollup.service_id)
+        .where(AppointmentRollup.day >= date_from, AppointmentRollup.day < date_to)
+        .group_by(*columns)
+        .having(
+            func.sum(AppointmentRollup.appointments + AppointmentRollup.cancelled) > 0
+        )
+        .order_by(*columns)
+    )
+    rows = (await session.execute(statement)).all()
+
+    # Opening minutes behind one row: a single day when grouped by day,
+    # the whole range otherwise.
+    capacity = OPEN_MINUTES * (1 if "day" in names else days)
+    report = []
+    for row in rows:
+        utilization = None
+        if "master" in names and capacity > 0:
+            utilization = round(row.booked_minutes / capacity, 4)
+        report.append(RevenueReportRow(**row._mapping, utilization=utilization))
+
+    return report
@@ -1,22 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Query, Request
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models import Service
 from schemas import ServiceCreate, ServiceRead, ServiceUpdate
-from database import get_session
+from database import get_async_session, get_read_session
+from pagination import fetch_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from catalog import service_catalog, service_records, catalog_response
+from search import SEARCH_MAX_RESULTS, service_search
+from repository import service_repository
+from typing import Optional
 import logging
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
 @router.post("/", response_model=ServiceRead, status_code=201)
-def create_service(service: ServiceCreate, session: Session = Depends(get_session)):
-    statement = select(Service).where(Service.name == service.name)
-    existing_service = session.exec(statement).first()
-
-    if existing_service:
-        raise HTTPException(status_code=400, detail="Service already exists")
-
+async def create_service(
+    service: ServiceCreate,
+    session: AsyncSession = Depends(get_async_session)
+):
     new_service = Service(
         name=service.name,
         description=service.description,
@@ -24,67 +28,73 @@ def create_service(service: ServiceCreate, session: Session = Depends(get_sessio
         duration=service.duration
     )
 
-    session.add(new_service)
-    session.commit()
-    session.refresh(new_service)
+    await service_repository.create(session, new_service)
+    service_catalog.invalidate()
+    service_search.invalidate()
 
     logger.info(f"Service created: {new_service.name}")
     return new_service
 
 
 @router.get("/", response_model=list[ServiceRead])
-def get_services(session: Session = Depends(get_session)):
-    statement = select(Service)
-    services = session.exec(statement).all()
-    return services
+async def get_services(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_async_session)
+):
+    statement = service_repository.active(select(Service))
+    # Loaded from the primary; see get_masters.
+    page = await service_catalog.get_or_load(
+        (after, limit),
+        lambda: fetch_page(session, statement, (Service.id,), after, limit),
+    )
+    return catalog_response(request, page)
 
 
-@router.get("/{service_id}", response_model=ServiceRead)
-def get_service(service_id: str, session: Session = Depends(get_session)):
-    statement = select(Service).where(Service.id == service_id)
-    service = session.exec(statement).first()
+@router.get("/search", response_model=list[ServiceRead])
+async def search_services(
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_RESULTS),
+    session: AsyncSession = Depends(get_read_session)
+):
+    # Case-insensitive match on name and description, best matches first.
+    return await service_search.search(session, q, limit, offset)
 
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
 
-    return service
+@router.get("/{service_id}", response_model=ServiceRead)
+async def get_service(request: Request, service_id: uuid.UUID):
+    # A spike on one service costs one query per RECORD_CACHE_TTL per worker.
+    page = await service_records.get(service_id)
+    return catalog_response(request, page)
 
 
 @router.put("/{service_id}", response_model=ServiceRead)
-def update_service(
-    service_id: str,
+async def update_service(
+    service_id: uuid.UUID,
     service_update: ServiceUpdate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    statement = select(Service).where(Service.id == service_id)
-    service = session.exec(statement).first()
-
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
-
     update_data = service_update.model_dump(exclude_unset=True)
-
-    for key, value in update_data.items():
-        setattr(service, key, value)
-
-    session.add(service)
-    session.commit()
-    session.refresh(service)
+    service = await service_repository.update(session, service_id, update_data)
+    service_catalog.invalidate()
+    service_records.invalidate(service_id)
+    service_search.invalidate()
 
     logger.info(f"Service updated: {service.name}")
     return service
 
 
 @router.delete("/{service_id}")
-def delete_service(service_id: str, session: Session = Depends(get_session)):
-    statement = select(Service).where(Service.id == service_id)
-    service = session.exec(statement).first()
-
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
-
-    session.delete(service)
-    session.commit()
+async def delete_service(
+    service_id: uuid.UUID,
+    session: AsyncSession = Depends(get_async_session)
+):
+    service = await service_repository.delete(session, service_id)
+    service_catalog.invalidate()
+    service_records.invalidate(service_id)
+    service_search.invalidate()
 
     logger.info(f"Service deleted: {service.name}")
     return {"message": "Service deleted successfully"}
@@ -1,26 +1,43 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-from passlib.context import CryptContext
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models import User
 from schemas import UserCreate, UserRead, UserLogin, Token
-from database import get_session
+from database import get_async_session, get_read_session
 from jwt_utils import create_access_token
+from auth import password_hasher, get_current_user
+from availability import occupancy
+from events import appointment_feed
+from rollups import remove_user_appointments
+from pagination import fetch_page, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from serialization import (
+    LEAN_RESPONSES,
+    dump_rows,
+    json_response,
+    parse_fields,
+    select_columns,
+)
+from repository import user_repository
+from typing import Optional
 import logging
+import uuid
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 logger = logging.getLogger(__name__)
 
 
 @router.post("/", response_model=UserRead, status_code=201)
-def create_user(user: UserCreate, session: Session = Depends(get_session)):
-    statement = select(User).where(User.email == user.email)
-    existing_user = session.exec(statement).first()
-
-    if existing_user:
+async def create_user(
+    user: UserCreate,
+    session: AsyncSession = Depends(get_async_session)
+):
+    # Cheap indexed check first, so duplicate signups cost no bcrypt work;
+    # the unique constraint still catches concurrent ones.
+    statement = select(User.id).where(User.email == user.email)
+    if (await session.exec(statement)).first() is not None:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
 
     new_user = User(
         email=user.email,
@@ -28,20 +45,23 @@ def create_user(user: UserCreate, session: Session = Depends(get_session)):
         name=user.name
     )
 
-    session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await user_repository.create(session, new_user)
 
     logger.info(f"User created: {new_user.email}")
     return new_user
 
 
 @router.post("/login/", response_model=Token)
-def login(credentials: UserLogin, session: Session = Depends(get_session)):
+async def login(
+    credentials: UserLogin,
+    session: AsyncSession = Depends(get_async_session)
+):
     statement = select(User).where(User.email == credentials.email)
-    user = session.exec(statement).first()
+    user = (await session.exec(statement)).first()
 
-    if not user or not pwd_context.verify(credentials.password, user.hashed_password):
+    if not user or not await password_hasher.verify(
+        credentials.password, user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     access_token = create_access_token(
@@ -53,33 +73,44 @@ def login(credentials: UserLogin, session: Session = Depends(get_session)):
 
 
 @router.get("/", response_model=list[UserRead])
-def get_users(session: Session = Depends(get_session)):
+async def get_users(
+    response: Response,
+    fields: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_session)
+):
+    if LEAN_RESPONSES or fields:
+        columns = parse_fields(fields, UserRead)
+        statement = select(*select_columns(User, columns, (User.id,)))
+        rows, next_cursor = await fetch_page(
+            session, statement, (User.id,), after, limit
+        )
+        return json_response(dump_rows(rows, columns), next_cursor)
+
     statement = select(User)
-    users = session.exec(statement).all()
-    return users
+    return await paginate(session, statement, (User.id,), after, limit, response)
 
 
-@router.get("/{user_id}", response_model=UserRead)
-def get_user(user_id: str, session: Session = Depends(get_session)):
-    statement = select(User).where(User.id == user_id)
-    user = session.exec(statement).first()
+@router.get("/me", response_model=UserRead)
+async def get_me(current_user: UserRead = Depends(get_current_user)):
+    return current_user
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
 
-    return user
+@router.get("/{user_id}", response_model=UserRead)
+async def get_user(user_id: uuid.UUID, session: AsyncSession = Depends(get_read_session)):
+    return await user_repository.get(session, user_id)
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: str, session: Session = Depends(get_session)):
-    statement = select(User).where(User.id == user_id)
-    user = session.exec(statement).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    session.delete(user)
-    session.commit()
+async def delete_user(user_id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+    slots = await remove_user_appointments(session, user_id)
+    user = await user_repository.delete(session, user_id)
+    await appointment_feed.forget_user(user.id)
+    # The user's appointments went with ON DELETE CASCADE without being
+    # loaded, so the days they were on are dropped and reloaded on demand.
+    occupancy.discard_days(slots)
+    await appointment_feed.reset(slots)
 
     logger.info(f"User deleted: {user.email}")
     return {"message": "User deleted successfully"}
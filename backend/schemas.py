@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, field_validator
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 import uuid
 
 
@@ -89,6 +89,7 @@ class AppointmentCreate(BaseModel):
 class AppointmentRead(BaseModel):
     id: uuid.UUID
     date_time: datetime
+    end_time: datetime
     status: str
     user_id: uuid.UUID
     master_id: uuid.UUID
@@ -97,9 +98,57 @@ class AppointmentRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AppointmentExpanded(AppointmentRead):
+    user: Optional[UserRead] = None
+    master: Optional[MasterRead] = None
+    service: Optional[ServiceRead] = None
+
+
+class AppointmentBulkResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[uuid.UUID] = None
+    detail: Optional[str] = None
+
+
+class AppointmentBulkRead(BaseModel):
+    created: int
+    rejected: int
+    results: list[AppointmentBulkResult]
+
+
 class AppointmentUpdate(BaseModel):
     date_time: Optional[datetime] = None
     status: Optional[str] = None
     user_id: Optional[uuid.UUID] = None
     master_id: Optional[uuid.UUID] = None
     service_id: Optional[uuid.UUID] = None
+
+    # Omitted fields stay unchanged; none of them can be cleared.
+    @field_validator("*", mode="before")
+    @classmethod
+    def reject_null(cls, value):
+        if value is None:
+            raise ValueError("must not be null")
+        return value
+
+
+class RevenueReportRow(BaseModel):
+    # Grouping columns not requested in group_by are null.
+    day: Optional[date] = None
+    master_id: Optional[uuid.UUID] = None
+    service_id: Optional[uuid.UUID] = None
+    appointments: int
+    cancelled: int
+    booked_minutes: int
+    revenue: float
+    # Booked share of opening hours; only when grouped by master.
+    utilization: Optional[float] = None
+
+
+class AvailabilityRead(BaseModel):
+    master_id: uuid.UUID
+    service_id: uuid.UUID
+    date: date
+    duration: int
+    slots: list[datetime]
@@ -0,0 +1,152 @@
+from sqlalchemy import case, func, or_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from bisect import bisect_left
+from typing import Optional
+from repository import Repository, master_repository, service_repository
+from cache import Generation
+import os
+import time
+
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "200"))
+# How long another worker's in-memory index may lag behind a write.
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+# Rank of a match, best first.
+PRIMARY_PREFIX, PRIMARY_SUBSTRING, SECONDARY_PREFIX, SECONDARY_SUBSTRING = range(4)
+
+
+def _rank(texts: tuple[str, str], query: str) -> Optional[int]:
+    primary, secondary = texts
+    if primary.startswith(query):
+        return PRIMARY_PREFIX
+    if query in primary:
+        return PRIMARY_SUBSTRING
+    if secondary.startswith(query):
+        return SECONDARY_PREFIX
+    if query in secondary:
+        return SECONDARY_SUBSTRING
+    return None
+
+
+class PrefixIndex:
+    # Every suffix of every word of the searched fields, sorted, so any
+    # substring of a word is a prefix lookup with bisect. Used where the
+    # database has no trigram indexes (SQLite).
+    def __init__(self, rows: list, fields: tuple[str, str]):
+        self.rows = {row.id: row for row in rows}
+        self.texts = {
+            row.id: tuple((getattr(row, field) or "").casefold() for field in fields)
+            for row in rows
+        }
+        entries = {
+            (word[start:], row_id)
+            for row_id, texts in self.texts.items()
+            for text in texts
+            for word in text.split()
+            for start in range(len(word))
+        }
+        entries = sorted(entries)
+        self._suffixes = [suffix for suffix, _ in entries]
+        self._ids = [row_id for _, row_id in entries]
+
+    def search(self, query: str) -> list:
+        query = query.casefold()
+        words = query.split()
+        if not words:
+            return []
+
+        # Candidates share the longest query word; the whole query is then
+        # checked against each candidate's text.
+        word = max(words, key=len)
+        candidates = set()
+        position = bisect_left(self._suffixes, word)
+        while (
+            position < len(self._suffixes)
+            and self._suffixes[position].startswith(word)
+        ):
+            candidates.add(self._ids[position])
+            position += 1
+
+        ranked = []
+        for row_id in candidates:
+            rank = _rank(self.texts[row_id], query)
+            if rank is not None:
+                ranked.append((rank, self.texts[row_id][0], str(row_id), row_id))
+        ranked.sort()
+        return [self.rows[row_id] for *_, row_id in ranked]
+
+
+class CatalogSearch:
+    # Ranked substring search over two text fields of the active rows:
+    # matches in `primary` rank above matches in `secondary`, prefixes above
+    # other substrings, then alphabetical.
+    def __init__(self, repository: Repository, primary: str, secondary: str):
+        self.repository = repository
+        self.fields = (primary, secondary)
+        self._index: Optional[PrefixIndex] = None
+        self._built_at = 0.0
+        self._generation = Generation()
+
+    async def search(
+        self, session: AsyncSession, query: str, limit: int, offset: int
+    ) -> list:
+        if session.bind.dialect.name == "postgresql":
+            return await self._search_sql(session, query, limit, offset)
+
+        index = await self._get_index(session)
+        return index.search(query)[offset:offset + limit]
+
+    async def _search_sql(
+        self, session: AsyncSession, query: str, limit: int, offset: int
+    ) -> list:
+        # lower(...) LIKE '%query%' is served by the pg_trgm GIN indexes on
+        # the same expressions (queries shorter than 3 chars scan instead).
+        model = self.repository.model
+        primary, secondary = (
+            func.lower(getattr(model, field)) for field in self.fields
+        )
+        query = query.lower()
+        rank = case(
+            (primary.startswith(query, autoescape=True), PRIMARY_PREFIX),
+            (primary.contains(query, autoescape=True), PRIMARY_SUBSTRING),
+            (secondary.startswith(query, autoescape=True), SECONDARY_PREFIX),
+            else_=SECONDARY_SUBSTRING,
+        )
+        statement = (
+            self.repository.active(select(model))
+            .where(or_(
+                primary.contains(query, autoescape=True),
+                secondary.contains(query, autoescape=True),
+            ))
+            .order_by(rank, primary, model.id)
+            .offset(offset)
+            .limit(limit)
+        )
+        return (await session.exec(statement)).all()
+
+    async def _get_index(self, session: AsyncSession) -> PrefixIndex:
+        if (
+            self._index is not None
+            and time.monotonic() - self._built_at < SEARCH_INDEX_TTL
+        ):
+            return self._index
+
+        generation = self._generation.value
+        rows = (
+            await session.exec(self.repository.active(select(self.repository.model)))
+        ).all()
+        index = PrefixIndex(rows, self.fields)
+
+        if self._generation.unchanged_since(generation):
+            self._index = index
+            self._built_at = time.monotonic()
+        return index
+
+    def invalidate(self) -> None:
+        self._generation.advance()
+        self._index = None
+
+
+master_search = CatalogSearch(master_repository, "name", "specialty")
+service_search = CatalogSearch(service_repository, "name", "description")
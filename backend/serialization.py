@@ -0,0 +1,95 @@
+from fastapi import HTTPException, Response
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Iterable, Optional
+from pagination import NEXT_CURSOR_HEADER
+import orjson
+import os
+
+# List endpoints select only the response columns and encode the row tuples
+# with orjson, skipping ORM objects and response_model validation. False
+# restores the validated path (benchmarks/serialization.py compares both).
+LEAN_RESPONSES = os.getenv("LEAN_RESPONSES", "true").lower() in ("1", "true", "yes")
+# Responses smaller than this are sent uncompressed.
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+
+def parse_fields(fields: Optional[str], schema) -> list[str]:
+    # ?fields=id,date_time -> the requested subset of the schema's fields,
+    # in request order; all of them when the parameter is absent.
+    allowed = list(schema.model_fields)
+    if not fields:
+        return allowed
+
+    names = list(dict.fromkeys(
+        name.strip() for name in fields.split(",") if name.strip()
+    ))
+    unknown = sorted(set(names) - set(allowed))
+
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"fields takes a comma-separated subset of: {', '.join(allowed)}"
+        )
+
+    return names
+
+
+def select_columns(model, names: list[str], keys: Iterable = ()) -> list:
+    # The requested columns first, then any pagination key not among them,
+    # so a row's leading values line up with `names`.
+    columns = [getattr(model, name) for name in names]
+    columns += [key for key in keys if key.key not in names]
+    return columns
+
+
+def dump_rows(rows, names: list[str]) -> bytes:
+    # orjson writes UUIDs and naive datetimes exactly as pydantic does.
+    return orjson.dumps([dict(zip(names, row)) for row in rows])
+
+
+def json_response(body: bytes, next_cursor: Optional[str] = None) -> Response:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor is not None else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class StreamSafeGZipMiddleware(GZipMiddleware):
+    # Starlette holds streamed bodies in the compressor until it fills,
+    # which would delay server-sent events; their paths skip compression.
+    def __init__(self, app: ASGIApp, excluded_paths: Iterable[str] = (), **options):
+        super().__init__(app, **options)
+        self.excluded_paths = frozenset(excluded_paths)
+        self.inner = app
+        self.app = self._coalesced
+
+    async def _coalesced(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # @app.middleware layers stream every body, even one sent in a
+        # single piece, and the compressor treats any streamed body as
+        # large. Merging chunks up to minimum_size keeps small responses
+        # uncompressed.
+        pending: list[bytes] = []
+        size = 0
+
+        async def coalesce(message: dict) -> None:
+            nonlocal size
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            pending.append(message.get("body", b""))
+            size += len(pending[-1])
+            more_body = message.get("more_body", False)
+            if more_body and size < self.minimum_size:
+                return
+            body = b"".join(pending)
+            pending.clear()
+            size = 0
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.inner(scope, receive, coalesce)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.excluded_paths:
+            await self.inner(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -1,13 +1,46 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 import os
 import logging
-from routers import users, masters, services, appointments
-from database import init_db
+from routers import users, masters, services, appointments, reports
+from database import init_db, engine, async_engine, replicas
+from events import appointment_feed
+from catalog import master_records, service_records
+from admission import admission
+from serialization import (
+    GZIP_LEVEL,
+    GZIP_MINIMUM_SIZE,
+    StreamSafeGZipMiddleware,
+)
+from migrations import SchemaMismatch, check_schema
+from partitions import PartitionMaintainer
+from idempotency import (
+    REPLAYED_HEADER,
+    handle_idempotent_post,
+    stats as idempotency_stats,
+)
+from auth import password_hasher
+from metrics import (
+    RequestStats,
+    current_request,
+    instrument_engine,
+    registry,
+    route_name,
+    server_timing,
+)
+import sys
+import time
 
 load_dotenv()
 
+# Skip the startup schema check entirely, e.g. when a deploy step has already
+# run `python migrations.py` and workers should be ready immediately.
+SKIP_DB_INIT = os.getenv("SKIP_DB_INIT", "false").lower() in ("1", "true", "yes")
+# Let a worker that finds an outdated schema migrate it instead of failing.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -24,18 +57,165 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing", REPLAYED_HEADER],
 )
 
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+for replica in replicas.engines:
+    instrument_engine(replica.sync_engine)
+
+def password_hash_metrics():
+    stats = password_hasher.stats()
+    return [
+        ("password_hash_in_flight", "gauge",
+         "Password hash/verify jobs submitted and not finished.",
+         [({}, stats["in_flight"])]),
+        ("password_hash_queued", "gauge",
+         "Password jobs waiting for a free worker process.",
+         [({}, stats["queued"])]),
+        ("password_hash_completed_total", "counter",
+         "Password jobs finished.",
+         [({}, stats["completed"])]),
+    ]
+
+registry.add_collector(password_hash_metrics)
+
+def replica_metrics():
+    return [
+        ("db_replica_healthy", "gauge",
+         "1 if the read replica passed its last health check.",
+         [({"replica": index}, int(healthy))
+          for index, healthy in enumerate(replicas.healthy)]),
+    ]
+
+registry.add_collector(replica_metrics)
+
+def idempotency_metrics():
+    return [
+        ("idempotent_replays_total", "counter",
+         "Retried POSTs answered from the Idempotency-Key store.",
+         [({}, idempotency_stats["replayed"])]),
+        ("idempotent_conflicts_total", "counter",
+         "Idempotency-Key reuse rejected as in progress or mismatched.",
+         [({}, idempotency_stats["conflicts"])]),
+    ]
+
+registry.add_collector(idempotency_metrics)
+
+def event_feed_metrics():
+    return [
+        ("appointment_feed_subscribers", "gauge",
+         "Open appointment event streams on this worker.",
+         [({}, appointment_feed.subscriber_count())]),
+    ]
+
+registry.add_collector(event_feed_metrics)
+
+def record_cache_metrics():
+    return [
+        ("catalog_record_requests_total", "counter",
+         "By-id master/service reads: cached hit, joined an in-flight load, or load.",
+         [({"model": name, "result": result}, count)
+          for name, records in (("master", master_records), ("service", service_records))
+          for result, count in records.stats.items()]),
+    ]
+
+registry.add_collector(record_cache_metrics)
+
+def admission_metrics():
+    return [
+        ("admission_in_flight", "gauge",
+         "Requests running on routes with a concurrency limit.",
+         [({"route": name}, count) for name, count in admission.in_flight.items()]),
+        ("admission_shed_total", "counter",
+         "Requests rejected by admission control (429 rate, 503 concurrency).",
+         [({"route": name, "reason": reason}, count)
+          for (name, reason), count in admission.shed.items()]),
+    ]
+
+registry.add_collector(admission_metrics)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = RequestStats(request.scope)
+    token = current_request.set(stats)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_request.reset(token)
+    elapsed = time.perf_counter() - started
+
+    registry.observe_request(
+        request.method,
+        route_name(request.scope),
+        response.status_code,
+        elapsed,
+        stats,
+    )
+    response.headers["Server-Timing"] = server_timing(stats, elapsed)
+    return response
+
+# Registered last so it wraps the metrics middleware: replays skip routing
+# and are counted by idempotent_replays_total instead.
+@app.middleware("http")
+async def idempotent_posts(request: Request, call_next):
+    return await handle_idempotent_post(request, call_next)
+
+# Outermost: shed requests cost no routing, idempotency or metrics work and
+# are counted by admission_shed_total.
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    return await admission.handle(request, call_next)
+
+# Compresses what every other layer produced, for clients that accept gzip.
+app.add_middleware(
+    StreamSafeGZipMiddleware,
+    excluded_paths={"/api/appointments/events"},
+    minimum_size=GZIP_MINIMUM_SIZE,
+    compresslevel=GZIP_LEVEL,
+)
+
+partition_maintainer = PartitionMaintainer(engine)
+
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(masters.router, prefix="/api/masters", tags=["masters"])
 app.include_router(services.router, prefix="/api/services", tags=["services"])
 app.include_router(appointments.router, prefix="/api/appointments", tags=["appointments"])
+app.include_router(reports.router, prefix="/api/reports", tags=["reports"])
+admission.bind(app.router.routes)
 
 @app.on_event("startup")
-def on_startup():
-    logger.info("Initializing database...")
-    init_db()
-    logger.info("Database initialized successfully")
+async def on_startup():
+    if SKIP_DB_INIT:
+        logger.info("Skipping database schema check")
+    else:
+        try:
+            check_schema(engine)
+        except SchemaMismatch as exc:
+            if not DB_AUTO_MIGRATE:
+                raise
+            logger.info(f"{exc}; migrating")
+            init_db()
+        logger.info("Database schema is current")
+    replicas.start()
+    appointment_feed.start(async_engine)
+    partition_maintainer.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    password_hasher.shutdown()
+    await replicas.stop()
+    await appointment_feed.stop()
+    await partition_maintainer.stop()
+
+@app.get("/api/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4",
+    )
 
 @app.get("/api/")
 def root():
@@ -43,4 +223,6 @@ def root():
 
 if __name__ == "__main__":
     import uvicorn
+    if "--skip-db-init" in sys.argv[1:]:
+        SKIP_DB_INIT = True
     uvicorn.run(app, host="0.0.0.0", port=8000)
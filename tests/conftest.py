@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import uuid
+
+# The app reads its settings at import time, so they are set before any
+# backend module is imported: a throwaway SQLite database and cheap bcrypt.
+DATABASE_DIR = tempfile.mkdtemp(prefix="salon-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DATABASE_DIR, 'test.db')}"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["PASSWORD_HASH_WORKERS"] = "1"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    from server import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def user(client):
+    response = client.post("/api/users/", json={
+        "email": f"{uuid.uuid4().hex}@test.example.com",
+        "password": "secret",
+        "name": "Test User",
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.fixture
+def make_master(client):
+    def make_master(**fields):
+        response = client.post("/api/masters/", json={
+            "name": "Test Master",
+            "sex": "f",
+            "phone": f"+7{uuid.uuid4().int % 10**10:010d}",
+            "experience": 3,
+            "specialty": "hair",
+            **fields,
+        })
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return make_master
+
+
+@pytest.fixture
+def master(make_master):
+    return make_master()
+
+
+@pytest.fixture
+def service(client):
+    # 60 minutes, so bookings on the hour touch without overlapping.
+    response = client.post("/api/services/", json={
+        "name": f"Haircut {uuid.uuid4().hex}",
+        "description": "Test service",
+        "price": 1000,
+        "duration": 60,
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.fixture
+def book(client, user, master, service):
+    # POST /api/appointments/ for the fixture user, master and service.
+    def book(date_time: str, **fields):
+        return client.post("/api/appointments/", json={
+            "date_time": date_time,
+            "user_id": user["id"],
+            "master_id": master["id"],
+            "service_id": service["id"],
+            **fields,
+        })
+
+    return book
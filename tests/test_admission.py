@@ -0,0 +1,52 @@
+from admission import TokenBucket, admission
+from cache import TTLCache
+
+
+def login(client, user):
+    return client.post(
+        "/api/users/login/", json={"email": user["email"], "password": "secret"}
+    )
+
+
+def test_login_over_the_concurrency_limit_is_shed(client, user, monkeypatch):
+    limit = admission.concurrency["login"]
+    monkeypatch.setitem(admission.in_flight, "login", limit)
+    shed = admission.shed.get(("login", "concurrency"), 0)
+
+    response = login(client, user)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert admission.shed[("login", "concurrency")] == shed + 1
+    # Routes without a limit are not affected.
+    assert client.get("/api/services/").status_code == 200
+
+    monkeypatch.setitem(admission.in_flight, "login", limit - 1)
+    assert login(client, user).status_code == 200
+    assert admission.in_flight["login"] == limit - 1
+
+
+def test_login_over_the_rate_limit_gets_429(client, user, monkeypatch):
+    monkeypatch.setattr(admission, "rates", {**admission.rates, "login": 0.01})
+    monkeypatch.setattr(admission, "bursts", {**admission.bursts, "login": 2})
+    monkeypatch.setattr(admission, "_buckets", TTLCache(10))
+
+    assert login(client, user).status_code == 200
+    assert login(client, user).status_code == 200
+    response = login(client, user)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 1
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("admission.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=2)
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == 0.5
+
+    now[0] += 0.5
+    assert bucket.take() == 0
@@ -0,0 +1,73 @@
+OVERLAP_DETAIL = "Master already has an appointment at this time"
+
+
+# Overlap rules (user-002)
+
+def test_create_rejects_overlapping_booking(book):
+    assert book("2030-01-07T10:00:00").status_code == 201
+
+    response = book("2030-01-07T10:30:00")
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == OVERLAP_DETAIL
+
+
+def test_create_allows_touching_bookings(book):
+    assert book("2030-01-07T10:00:00").status_code == 201
+
+    assert book("2030-01-07T09:00:00").status_code == 201
+    assert book("2030-01-07T11:00:00").status_code == 201
+
+
+def test_cancelled_booking_frees_its_slot(client, book):
+    first = book("2030-01-07T10:00:00").json()
+    response = client.put(
+        f"/api/appointments/{first['id']}", json={"status": "cancelled"}
+    )
+    assert response.status_code == 200
+
+    assert book("2030-01-07T10:30:00").status_code == 201
+
+
+def test_update_rejects_moving_onto_another_booking(client, book):
+    book("2030-01-07T10:00:00")
+    second = book("2030-01-07T12:00:00").json()
+
+    response = client.put(
+        f"/api/appointments/{second['id']}", json={"date_time": "2030-01-07T10:45:00"}
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == OVERLAP_DETAIL
+
+
+def test_update_allows_touching_and_own_slot(client, book):
+    book("2030-01-07T10:00:00")
+    second = book("2030-01-07T12:00:00").json()
+
+    moved = client.put(
+        f"/api/appointments/{second['id']}", json={"date_time": "2030-01-07T11:00:00"}
+    )
+    assert moved.status_code == 200
+    assert moved.json()["end_time"] == "2030-01-07T12:00:00"
+
+    # Overlapping its own previous interval is not a conflict.
+    shifted = client.put(
+        f"/api/appointments/{second['id']}", json={"date_time": "2030-01-07T11:30:00"}
+    )
+    assert shifted.status_code == 200
+
+
+
+def test_update_rejects_explicit_nulls(client, book):
+    appointment = book("2030-01-07T10:00:00").json()
+
+    for field in ("date_time", "status", "master_id", "user_id", "service_id"):
+        response = client.put(
+            f"/api/appointments/{appointment['id']}", json={field: None}
+        )
+        assert response.status_code == 422, field
+
+    current = client.get(f"/api/appointments/{appointment['id']}").json()
+    assert current["date_time"] == appointment["date_time"]
+    assert current["status"] == appointment["status"]
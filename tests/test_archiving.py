@@ -0,0 +1,39 @@
+import uuid
+
+
+def test_archived_master_cannot_be_booked(client, book, master):
+    assert client.delete(f"/api/masters/{master['id']}").status_code == 200
+
+    response = book("2030-04-01T10:00:00")
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Master not found"
+
+
+def test_booking_cannot_move_to_archived_master(client, book, make_master):
+    appointment = book("2030-04-02T10:00:00").json()
+    archived = make_master()
+    client.delete(f"/api/masters/{archived['id']}")
+
+    response = client.put(
+        f"/api/appointments/{appointment['id']}", json={"master_id": archived["id"]}
+    )
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Master not found"
+
+
+def test_unknown_user_is_not_found(book):
+    response = book("2030-04-03T10:00:00", user_id=str(uuid.uuid4()))
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
+
+
+def test_archived_master_is_hidden(client, make_master):
+    archived = make_master()
+    assert client.delete(f"/api/masters/{archived['id']}").status_code == 200
+
+    assert client.get(f"/api/masters/{archived['id']}").status_code == 404
+    listed = [master["id"] for master in client.get("/api/masters/").json()]
+    assert archived["id"] not in listed
@@ -0,0 +1,53 @@
+import json
+
+import jwt
+
+from auth import token_cache
+from events import appointment_feed
+from jwt_utils import ALGORITHM, SECRET_KEY
+
+
+def login(client, user):
+    response = client.post(
+        "/api/users/login/", json={"email": user["email"], "password": "secret"}
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_me_is_served_from_the_token_cache(client, user):
+    headers = login(client, user)
+    token = headers["Authorization"].split()[1]
+
+    assert client.get("/api/users/me", headers=headers).json()["id"] == user["id"]
+    assert str(token_cache.get(token).id) == user["id"]
+
+
+def test_deleted_users_token_is_rejected(client, user):
+    headers = login(client, user)
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+
+    assert client.delete(f"/api/users/{user['id']}").status_code == 200
+
+    assert client.get("/api/users/me", headers=headers).status_code == 401
+
+
+def test_user_deleted_on_another_worker_is_forgotten(client, user):
+    headers = login(client, user)
+    token = headers["Authorization"].split()[1]
+    client.get("/api/users/me", headers=headers)
+
+    appointment_feed._receive(json.dumps(
+        {"type": "user_deleted", "origin": "other-worker", "user_id": user["id"]}
+    ))
+
+    assert token_cache.get(token) is None
+
+
+def test_token_without_exp_is_rejected(client, user):
+    token = jwt.encode({"sub": user["email"]}, SECRET_KEY, algorithm=ALGORITHM)
+
+    response = client.get("/api/users/me", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 401
+    assert token_cache.get(token) is None
@@ -0,0 +1,74 @@
+import uuid
+from datetime import date
+
+from availability import free_slots, occupancy
+
+
+def slots(client, master, service, day="2030-05-06"):
+    response = client.get(
+        f"/api/masters/{master['id']}/availability",
+        params={"date": day, "service_id": service["id"]},
+    )
+    assert response.status_code == 200, response.text
+    return [slot[11:16] for slot in response.json()["slots"]]
+
+
+def test_free_slots_skip_busy_intervals():
+    busy = [(10 * 60, 11 * 60, uuid.uuid4()), (12 * 60 + 30, 13 * 60, uuid.uuid4())]
+
+    free = free_slots(busy, 60)
+
+    assert 9 * 60 in free and 11 * 60 in free and 13 * 60 in free
+    # A slot may end exactly where a booking starts, but not overlap it.
+    assert 11 * 60 + 30 in free
+    assert 11 * 60 + 45 not in free
+    assert 9 * 60 + 15 not in free
+    assert free[-1] == 20 * 60
+
+
+def test_empty_day_is_fully_available(client, master, service):
+    free = slots(client, master, service)
+
+    assert free[0] == "09:00"
+    assert free[-1] == "20:00"
+    assert len(free) == 45
+
+
+def test_booking_blocks_its_slots(client, book, master, service):
+    book("2030-05-06T10:00:00")
+
+    free = slots(client, master, service)
+
+    assert "09:00" in free and "11:00" in free
+    assert not {"09:15", "10:00", "10:45"} & set(free)
+
+
+def test_cached_day_follows_writes(client, book, master, service):
+    # The day is loaded into the occupancy index by the first read; later
+    # writes patch it in place instead of dropping it.
+    assert "10:00" in slots(client, master, service)
+    key = (uuid.UUID(master["id"]), date(2030, 5, 6))
+    assert occupancy.get(*key) == []
+
+    appointment = book("2030-05-06T10:00:00").json()
+    assert "10:00" not in slots(client, master, service)
+    assert len(occupancy.get(*key)) == 1
+
+    client.put(
+        f"/api/appointments/{appointment['id']}", json={"date_time": "2030-05-06T15:00:00"}
+    )
+    free = slots(client, master, service)
+    assert "10:00" in free and "15:00" not in free
+
+    client.put(f"/api/appointments/{appointment['id']}", json={"status": "cancelled"})
+    assert "15:00" in slots(client, master, service)
+    assert occupancy.get(*key) == []
+
+
+def test_user_delete_frees_their_slots(client, book, user, master, service):
+    book("2030-05-06T10:00:00")
+    assert "10:00" not in slots(client, master, service)
+
+    assert client.delete(f"/api/users/{user['id']}").status_code == 200
+
+    assert "10:00" in slots(client, master, service)
@@ -0,0 +1,60 @@
+import uuid
+
+OVERLAP_DETAIL = "Master already has an appointment at this time"
+
+
+def test_bulk_rejects_conflicts_within_the_batch(client, user, master, service):
+    item = {"user_id": user["id"], "master_id": master["id"], "service_id": service["id"]}
+
+    response = client.post("/api/appointments/bulk", json=[
+        {**item, "date_time": "2030-03-01T10:00:00"},
+        {**item, "date_time": "2030-03-01T10:30:00"},
+        {**item, "date_time": "2030-03-01T11:00:00"},
+    ])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["rejected"]) == (2, 1)
+    assert [result["status"] for result in body["results"]] == [
+        "created", "conflict", "created",
+    ]
+    assert body["results"][1]["detail"] == OVERLAP_DETAIL
+
+
+def test_bulk_rejects_conflicts_with_existing_bookings(client, book, user, master, service):
+    book("2030-03-02T10:00:00")
+
+    response = client.post("/api/appointments/bulk", json=[{
+        "user_id": user["id"],
+        "master_id": master["id"],
+        "service_id": service["id"],
+        "date_time": "2030-03-02T10:15:00",
+    }])
+
+    assert response.json()["results"][0]["status"] == "conflict"
+
+
+def test_bulk_reports_unknown_ids(client, user, master, service):
+    item = {
+        "user_id": user["id"],
+        "master_id": master["id"],
+        "service_id": service["id"],
+        "date_time": "2030-03-03T10:00:00",
+    }
+    unknown = str(uuid.uuid4())
+
+    response = client.post("/api/appointments/bulk", json=[
+        {**item, "service_id": unknown},
+        {**item, "user_id": unknown},
+        {**item, "master_id": unknown},
+        item,
+    ])
+
+    body = response.json()
+    assert (body["created"], body["rejected"]) == (1, 3)
+    assert [(result["status"], result["detail"]) for result in body["results"]] == [
+        ("invalid", "Service not found"),
+        ("invalid", "User not found"),
+        ("invalid", "Master not found"),
+        ("created", None),
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+
+from cache import SingleFlight
+from catalog import master_records
+
+
+def test_catalog_list_revalidates_with_etag(client, service):
+    first = client.get("/api/services/")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    cached = client.get("/api/services/", headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+
+def test_catalog_write_changes_the_etag(client, service):
+    etag = client.get("/api/services/").headers["ETag"]
+
+    client.put(f"/api/services/{service['id']}", json={"price": 1500})
+    response = client.get("/api/services/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert any(row["price"] == 1500 for row in response.json())
+
+
+def test_record_revalidates_with_etag(client, master):
+    path = f"/api/masters/{master['id']}"
+    etag = client.get(path).headers["ETag"]
+
+    assert client.get(path, headers={"If-None-Match": f'"other", {etag}'}).status_code == 304
+    assert client.get(path, headers={"If-None-Match": "*"}).status_code == 304
+
+    client.put(path, json={"experience": 10})
+    response = client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json()["experience"] == 10
+
+
+def test_single_flight_shares_one_load():
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return loads
+
+    async def run():
+        flights = SingleFlight()
+        shared = await asyncio.gather(*(flights.do("key", load) for _ in range(5)))
+        again = await flights.do("key", load)
+        return shared, again
+
+    shared, again = asyncio.run(run())
+
+    assert shared == [1] * 5
+    # Finished loads are not kept; the next call starts a new one.
+    assert again == 2
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    async def run():
+        flights = SingleFlight()
+        load = lambda: asyncio.sleep(0.01, result="loaded")
+        first = asyncio.ensure_future(flights.do("key", load))
+        second = asyncio.ensure_future(flights.do("key", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "loaded"
+
+
+def test_record_cache_serves_repeat_reads(client, master):
+    path = f"/api/masters/{master['id']}"
+    before = dict(master_records.stats)
+
+    client.get(path)
+    client.get(path)
+    client.put(path, json={"experience": 7})
+    response = client.get(path)
+
+    assert response.json()["experience"] == 7
+    assert master_records.stats["load"] - before["load"] == 2
+    assert master_records.stats["hit"] - before["hit"] == 1
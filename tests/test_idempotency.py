@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import json
+import uuid
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import ASYNC_DB_URL
+from idempotency import (
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER,
+    DatabaseStore,
+    MemoryStore,
+    store,
+)
+
+
+def service_body(name):
+    return json.dumps({
+        "name": name, "description": "Test service", "price": 1000, "duration": 60,
+    }).encode()
+
+
+def post_service(client, key, name):
+    # Sent as raw bytes, so a retry hashes to exactly the same request.
+    return client.post("/api/services/", content=service_body(name), headers={
+        IDEMPOTENCY_HEADER: key, "Content-Type": "application/json",
+    })
+
+
+def test_retry_replays_the_first_response(client):
+    key, name = uuid.uuid4().hex, f"Replay {uuid.uuid4().hex}"
+
+    first = post_service(client, key, name)
+    retry = post_service(client, key, name)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert REPLAYED_HEADER not in first.headers
+    listed = [row for row in client.get("/api/services/").json() if row["name"] == name]
+    assert len(listed) == 1
+
+
+def test_key_reused_with_another_body_is_rejected(client):
+    key = uuid.uuid4().hex
+    assert post_service(client, key, f"First {key}").status_code == 201
+
+    response = post_service(client, key, f"Second {key}")
+
+    assert response.status_code == 422
+
+
+def test_duplicate_while_in_progress_gets_409(client):
+    key, name = uuid.uuid4().hex, f"Pending {uuid.uuid4().hex}"
+    # What a concurrent first request holds until its write completes.
+    request_hash = hashlib.sha256(service_body(name)).hexdigest()
+    asyncio.run(store.reserve("/api/services/", key, request_hash))
+
+    response = post_service(client, key, name)
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+
+
+def concurrent_reservations(store):
+    async def run():
+        return await asyncio.gather(
+            *(store.reserve("/api/masters/", "same-key", "hash") for _ in range(5))
+        )
+
+    return asyncio.run(run())
+
+
+def test_memory_store_admits_one_concurrent_duplicate():
+    results = concurrent_reservations(MemoryStore())
+
+    assert results.count(None) == 1
+    assert all(result.status_code is None for result in results if result is not None)
+
+
+def test_database_store_admits_one_concurrent_duplicate():
+    engine = create_async_engine(ASYNC_DB_URL)
+    try:
+        results = concurrent_reservations(DatabaseStore(engine))
+    finally:
+        asyncio.run(engine.dispose())
+
+    assert results.count(None) == 1
+    assert all(result.status_code is None for result in results if result is not None)
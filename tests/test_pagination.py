@@ -0,0 +1,45 @@
+def test_cursor_pages_cover_every_row_once(client, book, master):
+    created = [
+        book(f"2030-02-0{day}T{hour}:00:00").json()["id"]
+        for day in (1, 2, 3)
+        for hour in (10, 12)
+    ]
+
+    seen, pages, after = [], 0, None
+    while True:
+        params = {"master_id": master["id"], "limit": 4}
+        if after:
+            params["after"] = after
+        response = client.get("/api/appointments/", params=params)
+        assert response.status_code == 200
+        seen += [row["id"] for row in response.json()]
+        pages += 1
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+
+    assert pages == 2
+    assert seen == created
+
+
+def test_cursor_works_with_fields_excluding_the_keys(client, book, master):
+    for hour in (10, 12, 14):
+        book(f"2030-02-10T{hour}:00:00")
+
+    first = client.get("/api/appointments/", params={
+        "master_id": master["id"], "limit": 2, "fields": "status",
+    })
+    second = client.get("/api/appointments/", params={
+        "master_id": master["id"], "limit": 2, "fields": "status",
+        "after": first.headers["X-Next-Cursor"],
+    })
+
+    assert first.json() == [{"status": "pending"}] * 2
+    assert second.json() == [{"status": "pending"}]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_malformed_cursor_is_rejected(client):
+    response = client.get("/api/appointments/", params={"after": "not-a-cursor"})
+
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+from sqlmodel import Session, select
+
+from database import engine
+from models import AppointmentRollup
+from rollups import rebuild
+
+
+def report(client, master, **params):
+    response = client.get("/api/reports/revenue", params={
+        "date_from": "2030-06-01", "date_to": "2030-07-01",
+        "group_by": "day,master", **params,
+    })
+    assert response.status_code == 200, response.text
+    return {
+        row["day"]: row for row in response.json() if row["master_id"] == master["id"]
+    }
+
+
+def rollup_rows():
+    with Session(engine) as session:
+        rows = session.exec(select(AppointmentRollup)).all()
+        return sorted(
+            (row.day, str(row.master_id), str(row.service_id),
+             row.appointments, row.cancelled, row.booked_minutes)
+            for row in rows
+            if row.appointments or row.cancelled or row.booked_minutes
+        )
+
+
+def test_report_follows_create_update_and_delete(client, book, master):
+    first = book("2030-06-03T10:00:00").json()
+    second = book("2030-06-03T12:00:00").json()
+    third = book("2030-06-03T14:00:00").json()
+
+    client.put(f"/api/appointments/{first['id']}", json={"status": "cancelled"})
+    client.put(f"/api/appointments/{second['id']}", json={"date_time": "2030-06-04T12:00:00"})
+    client.delete(f"/api/appointments/{third['id']}")
+
+    rows = report(client, master)
+    assert (rows["2030-06-03"]["appointments"], rows["2030-06-03"]["cancelled"]) == (0, 1)
+    assert rows["2030-06-04"]["appointments"] == 1
+    assert rows["2030-06-04"]["booked_minutes"] == 60
+    assert rows["2030-06-04"]["revenue"] == 1000
+
+
+def test_rollups_match_a_rebuild(client, book, user, master, service):
+    for hour in (9, 11, 13):
+        book(f"2030-06-10T{hour:02d}:00:00")
+    moved = book("2030-06-10T15:00:00").json()
+    client.put(f"/api/appointments/{moved['id']}", json={"date_time": "2030-06-11T10:00:00"})
+    client.post("/api/appointments/bulk", json=[{
+        "user_id": user["id"], "master_id": master["id"],
+        "service_id": service["id"], "date_time": "2030-06-12T10:00:00",
+    }])
+    assert client.delete(f"/api/users/{user['id']}").status_code == 200
+
+    maintained = rollup_rows()
+    rebuild(engine)
+
+    assert rollup_rows() == maintained
+    assert report(client, master) == {}
+
+
+def test_report_rejects_unknown_grouping(client):
+    response = client.get("/api/reports/revenue", params={
+        "date_from": "2030-06-01", "date_to": "2030-07-01", "group_by": "user",
+    })
+
+    assert response.status_code == 400
@@ -0,0 +1,55 @@
+import uuid
+from types import SimpleNamespace
+
+from search import PrefixIndex
+
+
+def search(client, q, **params):
+    response = client.get("/api/masters/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [master["id"] for master in response.json()]
+
+
+def test_search_ranks_name_before_specialty(client, make_master):
+    token = f"zq{uuid.uuid4().hex[:8]}"
+    specialty_substring = make_master(name="Maria", specialty=f"nails {token}")
+    specialty_prefix = make_master(name="Olga", specialty=f"{token} hair")
+    name_substring = make_master(name=f"Irina Mal{token}")
+    name_prefix = make_master(name=f"{token.upper()}ova Anna")
+
+    assert search(client, token) == [
+        name_prefix["id"], name_substring["id"],
+        specialty_prefix["id"], specialty_substring["id"],
+    ]
+    assert search(client, token, limit=2, offset=1) == [
+        name_substring["id"], specialty_prefix["id"],
+    ]
+
+
+def test_search_follows_writes(client, make_master):
+    token = f"zq{uuid.uuid4().hex[:8]}"
+    master = make_master(name=f"Anna {token}")
+    assert search(client, token) == [master["id"]]
+
+    client.put(f"/api/masters/{master['id']}", json={"name": "Anna"})
+    assert search(client, token) == []
+
+    archived = make_master(name=f"Olga {token}")
+    client.delete(f"/api/masters/{archived['id']}")
+    assert search(client, token) == []
+
+
+def test_prefix_index_matches_substrings_of_words():
+    rows = [
+        SimpleNamespace(id=1, name="Anna Petrova", specialty="Hair colouring"),
+        SimpleNamespace(id=2, name="Olga", specialty="Nails"),
+        SimpleNamespace(id=3, name="Petra", specialty=None),
+    ]
+    index = PrefixIndex(rows, ("name", "specialty"))
+
+    assert [row.id for row in index.search("PETR")] == [3, 1]
+    assert [row.id for row in index.search("colour")] == [1]
+    # The whole query has to occur in one field, not just each word.
+    assert [row.id for row in index.search("anna petr")] == [1]
+    assert index.search("petr anna") == []
+    assert index.search("   ") == []